@@ -0,0 +1,34 @@
+import gc
+import os
+
+from noms_ops.memory import describe_memory_usage
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# CPUs are divided between workers for their processes scanning large tables, unless set, before settings are read
+os.environ.setdefault('NOMS_OPS_PARALLEL_WORKERS', str(max((os.cpu_count() or 1) // workers, 1)))
+# the dataset is loaded, indexed and frozen once in the master process and shared by the workers forked from it
+preload_app = True
+# workers log their memory use after serving this many requests
+memory_report_interval = int(os.environ.get('NOMS_OPS_MEMORY_REPORT_INTERVAL', '1000'))
+
+
+def when_ready(server):
+    # moves everything loaded so far out of the garbage collector's generations,
+    # so that collections in workers do not write to those objects and unshare the pages holding them
+    gc.collect()
+    gc.freeze()
+    server.log.info('Froze %d objects; master %s', gc.get_freeze_count(), describe_memory_usage())
+
+
+def post_fork(server, worker):
+    # imported once the application has been loaded and django configured
+    from noms_ops.query import start_scan_pool
+
+    start_scan_pool()
+    server.log.info('Worker %s forked; %s', worker.pid, describe_memory_usage())
+
+
+def post_request(worker, req, environ, resp):
+    if worker.nr % memory_report_interval == 0:
+        worker.log.info('Worker %s served %d requests; %s', worker.pid, worker.nr, describe_memory_usage())
@@ -20,6 +20,8 @@ class BasicAuthorisationMiddleware:
     def is_authorised(self, request):
         if not settings.BASIC_AUTH_USERNAME or not settings.BASIC_AUTH_PASSWORD:
             return True
+        if request.path_info.startswith(tuple(settings.BASIC_AUTH_PUBLIC_PATHS)):
+            return True
         authorisation = request.META.get('HTTP_AUTHORIZATION', '')
         authorisation = authorisation.split(' ')
         if not len(authorisation) == 2:
@@ -29,11 +31,12 @@ class BasicAuthorisationMiddleware:
             return False
         try:
             authorisation = base64.b64decode(authorisation_hash).decode()
-        except UnicodeDecodeError:
+        except ValueError:
             return False
-        authorisation = authorisation.split(':')
-        if not len(authorisation) == 2:
+        # passwords may contain colons but usernames cannot
+        username, separator, password = authorisation.partition(':')
+        if not separator:
             return False
-        username, password = map(unquote_plus, authorisation)
+        username, password = unquote_plus(username), unquote_plus(password)
         return constant_time_compare(username, settings.BASIC_AUTH_USERNAME) and \
             constant_time_compare(password, settings.BASIC_AUTH_PASSWORD)
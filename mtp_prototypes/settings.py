@@ -4,7 +4,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SECRET_KEY = '%=*q42^m_mv271y6+*q*-+1md%93_h%d73f7^@()lkt^y!lt46'
 
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', 'true').lower() == 'true'
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
@@ -52,6 +52,16 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # templates are parsed once per process, mtp_prototypes.wsgi compiles them before web server workers are forked
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'mtp_prototypes.wsgi.application'
 
 DATABASES = {}
@@ -64,6 +74,41 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
 
 BASIC_AUTH_USERNAME = os.environ.get('BASIC_AUTH_USERNAME')
 BASIC_AUTH_PASSWORD = os.environ.get('BASIC_AUTH_PASSWORD')
+# path prefixes served without basic authorisation
+BASIC_AUTH_PUBLIC_PATHS = ['/static/']
+
+NOMS_OPS_SEED = os.environ.get('NOMS_OPS_SEED')
+# generated dates are relative to this date, as YYYY-MM-DD, or to today if it is not set
+NOMS_OPS_BASE_DATE = os.environ.get('NOMS_OPS_BASE_DATE')
+NOMS_OPS_PRISONER_COUNT = int(os.environ.get('NOMS_OPS_PRISONER_COUNT', '80'))
+NOMS_OPS_SENDER_COUNT = int(os.environ.get('NOMS_OPS_SENDER_COUNT', '90'))
+NOMS_OPS_RECIPIENT_COUNT = int(os.environ.get('NOMS_OPS_RECIPIENT_COUNT', '40'))
+NOMS_OPS_CREDIT_COUNT = int(os.environ.get('NOMS_OPS_CREDIT_COUNT', '100'))
+NOMS_OPS_DISBURSEMENT_COUNT = int(os.environ.get('NOMS_OPS_DISBURSEMENT_COUNT', '60'))
+NOMS_OPS_BATCH_SIZE = int(os.environ.get('NOMS_OPS_BATCH_SIZE', '10000'))
+NOMS_OPS_SNAPSHOT = os.environ.get('NOMS_OPS_SNAPSHOT')
+# built tables and indexes that are memory-mapped and used in place, taking precedence over snapshots
+NOMS_OPS_DATASET_FILE = os.environ.get('NOMS_OPS_DATASET_FILE')
+# 'numpy' evaluates filters as vectorised masks when numpy is installed, 'python' tests each row
+NOMS_OPS_FILTER_ENGINE = os.environ.get('NOMS_OPS_FILTER_ENGINE', 'numpy')
+# filters scanning at least this many rows are split between this many processes, by default one per CPU up to 4;
+# gunicorn.conf.py divides CPUs between web server workers instead
+NOMS_OPS_PARALLEL_THRESHOLD = int(os.environ.get('NOMS_OPS_PARALLEL_THRESHOLD', '1000000'))
+NOMS_OPS_PARALLEL_WORKERS = int(os.environ.get('NOMS_OPS_PARALLEL_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# maximum number of matching row ids kept for recently used filters
+NOMS_OPS_RESULT_CACHE_SIZE = int(os.environ.get('NOMS_OPS_RESULT_CACHE_SIZE', '10000000'))
+# maximum memory in bytes used to keep the JSON encoding of rows
+NOMS_OPS_ROW_CACHE_SIZE = int(os.environ.get('NOMS_OPS_ROW_CACHE_SIZE', '67108864'))
+# maximum number of prisoner and sender tables kept with totals limited to recently used date windows
+NOMS_OPS_WINDOW_CACHE_SIZE = int(os.environ.get('NOMS_OPS_WINDOW_CACHE_SIZE', '32'))
+# 'compiled' renders result table rows by formatting cached fragments in Python, 'template' loops in the templates
+NOMS_OPS_ROW_RENDERER = os.environ.get('NOMS_OPS_ROW_RENDERER', 'compiled')
+# maximum memory in bytes used to keep rendered rows
+NOMS_OPS_FRAGMENT_CACHE_SIZE = int(os.environ.get('NOMS_OPS_FRAGMENT_CACHE_SIZE', '67108864'))
+# whether tables pack strings into buffers once loaded so that memory stays shared by forked web server workers
+NOMS_OPS_FREEZE_TABLES = os.environ.get('NOMS_OPS_FREEZE_TABLES', str(not DEBUG)).lower() == 'true'
+# whether the WSGI application compiles templates and renders the first page of each list before serving requests
+NOMS_OPS_WARM_UP = os.environ.get('NOMS_OPS_WARM_UP', str(not DEBUG)).lower() == 'true'
 
 LANGUAGE_CODE = 'en-gb'
 TIME_ZONE = 'Europe/London'
@@ -73,6 +118,20 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s [%(levelname)s] %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'mtp': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 GOVUK_SERVICE_SETTINGS = {
     'name': 'Prisoner money',
     'phase': 'beta',
@@ -1,7 +1,13 @@
+from django.conf import settings
+from django.contrib.staticfiles.views import serve
 from django.shortcuts import render
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 urlpatterns = [
     path('', lambda request: render(request, 'index.html'), name='index'),
     path('noms_ops/', include('noms_ops.urls', 'noms_ops')),
 ]
+
+if not settings.DEBUG:
+    # the prototype has no separate web server for static files
+    urlpatterns.append(re_path(r'^static/(?P<path>.*)$', serve, {'insecure': True}))
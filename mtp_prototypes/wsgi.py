@@ -1,7 +1,22 @@
+import logging
 import os
+import time
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+start_time = time.perf_counter()
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mtp_prototypes.settings')
 
 application = get_wsgi_application()
+
+# loads the dataset and builds its tables and indexes,
+# so when served by a pre-forking web server with the application preloaded, workers share them
+import noms_ops.tables  # noqa: E402,F401
+from noms_ops.startup import startup_report  # noqa: E402
+from noms_ops.warmup import warm_up  # noqa: E402
+
+if settings.NOMS_OPS_WARM_UP:
+    warm_up()
+logging.getLogger('mtp').info(startup_report(time.perf_counter() - start_time))
@@ -0,0 +1,56 @@
+import collections
+import threading
+
+
+class CacheInfo(collections.namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize', 'entries'))):
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+
+class LRUCache:
+    # least-recently-used cache limited by the total size of its values as measured by `sizeof`
+    def __init__(self, maxsize, sizeof=lambda value: 1):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, _ = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.maxsize:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = value, size
+            self.size += size
+            while self.size > self.maxsize:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, self.size, len(self.entries))
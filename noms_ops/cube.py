@@ -0,0 +1,248 @@
+import array
+import bisect
+import collections
+import threading
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from noms_ops.cache import LRUCache
+from noms_ops.startup import timed
+from noms_ops.store import EPOCH, IntegerColumn, RowIdColumn, Table
+from noms_ops.tables import prisoner_list, sender_list, credits_list, disbursement_list
+
+# microseconds in a day, the unit of stored date times
+DAY = 86400000000
+
+# prisoner or sender tables with counts and totals limited to a date window, keyed on the cube, window and dimensions
+window_tables = LRUCache(settings.NOMS_OPS_WINDOW_CACHE_SIZE)
+
+
+class AggregateCube:
+    # the number and total amount of credits or disbursements in each cell of an entity (prisoner or sender), day,
+    # prison and category (payment source or method); cells are stored in ascending day order so the totals of
+    # every entity within a date window are found by summing the cells of a range of days rather than walking the
+    # credits or disbursements themselves; built when first used and updated in place as rows are ingested
+    typecodes = ('i', 'i', 'h', 'h', 'q', 'q')
+
+    def __init__(self, facts, table, key, date_name, category_name, count_name, total_name):
+        self.facts = facts
+        self.table = table
+        self.key = key
+        self.date_name = date_name
+        self.category_name = category_name
+        self.count_name = count_name
+        self.total_name = total_name
+        self.days = None
+        self.entities = None
+        self.prisons = None
+        self.categories = None
+        self.counts = None
+        self.totals = None
+        # cell positions keyed on their dimensions, only needed once rows are ingested
+        self.positions = None
+        self.version = 0
+        # held while cells change and while numpy views of them exist as arrays cannot grow while viewed
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        self.build()
+        return len(self.days)
+
+    def __repr__(self):
+        return '<%s: %s by %s>' % (self.__class__.__name__, self.total_name, self.key)
+
+    def cell_arrays(self):
+        # in the order of `typecodes`
+        return self.days, self.entities, self.prisons, self.categories, self.counts, self.totals
+
+    def cell(self, row_id):
+        columns = self.facts.columns
+        category = self.facts.column(self.category_name)
+        return (
+            columns[self.date_name].values[row_id] // DAY,
+            columns[self.key].values[row_id],
+            columns['prison'].values[row_id],
+            category.column.values[category.keys.values[row_id]],
+        )
+
+    def build(self):
+        with self.lock:
+            if self.days is not None:
+                return
+            with timed('build aggregate cubes'):
+                if numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy':
+                    cells = self.numpy_cells()
+                else:
+                    cells = self.python_cells()
+                self.entities, self.prisons, self.categories, self.counts, self.totals = cells[1:]
+                # set last as it marks the cube as built
+                self.days = cells[0]
+
+    def python_cells(self):
+        columns = self.facts.columns
+        category = self.facts.column(self.category_name)
+        category_values = category.column.values
+        cells = {}
+        for date, entity, prison, category_key, amount in zip(
+                columns[self.date_name].values, columns[self.key].values, columns['prison'].values,
+                category.keys.values, columns['amount'].values):
+            cell = (date // DAY, entity, prison, category_values[category_key])
+            totals = cells.get(cell)
+            if totals is None:
+                cells[cell] = [1, amount]
+            else:
+                totals[0] += 1
+                totals[1] += amount
+        arrays = tuple(array.array(typecode) for typecode in self.typecodes)
+        for cell in sorted(cells):
+            for values, value in zip(arrays, cell + tuple(cells[cell])):
+                values.append(value)
+        return arrays
+
+    def numpy_cells(self):
+        # rows sorted by their cell, which start wherever any dimension changes
+        columns = self.facts.columns
+        category = self.facts.column(self.category_name)
+        with self.facts.lock:
+            dimensions = [
+                numpy.asarray(columns[self.date_name].values) // DAY,
+                numpy.asarray(columns[self.key].values),
+                numpy.asarray(columns['prison'].values),
+                numpy.asarray(category.column.values)[numpy.asarray(category.keys.values)],
+            ]
+            amounts = numpy.asarray(columns['amount'].values)
+            order = numpy.lexsort(dimensions[::-1])
+            dimensions = [values[order] for values in dimensions]
+            amounts = amounts[order]
+        changes = numpy.zeros(len(order), dtype=bool)
+        changes[:1] = True
+        for values in dimensions:
+            changes[1:] |= values[1:] != values[:-1]
+        starts = numpy.flatnonzero(changes)
+        counts = numpy.diff(numpy.append(starts, len(order)))
+        totals = numpy.add.reduceat(amounts, starts) if len(starts) else amounts[:0]
+        return tuple(
+            array.array(typecode, values.astype(typecode).tobytes())
+            for typecode, values in zip(self.typecodes, [values[starts] for values in dimensions] + [counts, totals])
+        )
+
+    def add(self, row_id):
+        # adds an ingested credit or disbursement to its cell; rows ingested before the cube is built are included
+        # when it is
+        with self.lock:
+            if self.days is None:
+                return
+            cell = self.cell(row_id)
+            if self.positions is None:
+                self.positions = {
+                    dimensions: position
+                    for position, dimensions in enumerate(zip(self.days, self.entities, self.prisons, self.categories))
+                }
+            position = self.positions.get(cell)
+            if position is None:
+                # new cells go after others of the same day, which is usually the last
+                position = bisect.bisect_right(self.days, cell[0])
+                for values, value in zip(self.cell_arrays(), cell + (0, 0)):
+                    values.insert(position, value)
+                if position == len(self.days) - 1:
+                    self.positions[cell] = position
+                else:
+                    # later cells have moved
+                    self.positions = None
+            self.counts[position] += 1
+            self.totals[position] += self.facts.columns['amount'].values[row_id]
+            self.version += 1
+
+    def window(self, gte=None, lte=None):
+        # positions of cells with days from `gte` until `lte` inclusive, either of which may be omitted
+        return range(
+            0 if gte is None else bisect.bisect_left(self.days, (gte - EPOCH.date()).days),
+            len(self.days) if lte is None else bisect.bisect_left(self.days, (lte - EPOCH.date()).days + 1),
+        )
+
+    def codes(self, prison, category):
+        # codes of the prison and category that cells are limited to, -1 if unknown so that no cells match
+        prison_code = category_code = None
+        if prison:
+            prison_code = self.facts.columns['prison'].codes.get(prison, -1)
+        if category:
+            category_code = self.facts.column(self.category_name).column.codes.get(category, -1)
+        return prison_code, category_code
+
+    def window_totals(self, gte=None, lte=None, prison=None, category=None):
+        # arrays of the count and total of every entity within the date window, optionally of one prison or category
+        with self.lock:
+            self.build()
+            window = self.window(gte, lte)
+            prison_code, category_code = self.codes(prison, category)
+            size = len(self.table)
+            if numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy':
+                return self.numpy_window_totals(window, prison_code, category_code, size)
+            counts, totals = array.array('q', bytes(8 * size)), array.array('q', bytes(8 * size))
+            entities, prisons, categories = self.entities, self.prisons, self.categories
+            cell_counts, cell_totals = self.counts, self.totals
+            for position in window:
+                if prison_code is not None and prisons[position] != prison_code:
+                    continue
+                if category_code is not None and categories[position] != category_code:
+                    continue
+                entity = entities[position]
+                counts[entity] += cell_counts[position]
+                totals[entity] += cell_totals[position]
+            return counts, totals
+
+    def numpy_window_totals(self, window, prison_code, category_code, size):
+        cells = slice(window.start, window.stop)
+        entities = numpy.asarray(self.entities)[cells]
+        cell_counts, cell_totals = numpy.asarray(self.counts)[cells], numpy.asarray(self.totals)[cells]
+        selected = None
+        for values, code in ((self.prisons, prison_code), (self.categories, category_code)):
+            if code is not None:
+                mask = numpy.asarray(values)[cells] == code
+                selected = mask if selected is None else selected & mask
+        if selected is not None:
+            entities, cell_counts, cell_totals = entities[selected], cell_counts[selected], cell_totals[selected]
+        # sums of weights are floating point but exact for totals below 2 ** 53
+        return tuple(
+            array.array('q', numpy.bincount(entities, weights=weights, minlength=size).astype(numpy.int64).tobytes())
+            for weights in (cell_counts, cell_totals)
+        )
+
+    def window_table(self, gte=None, lte=None, prison=None, category=None):
+        # the entity table with its count and total columns replaced by those within the window; other columns,
+        # indexes and orderings are shared with the entity table and the table is reused until either changes
+        with self.lock:
+            key = (self, gte, lte, prison, category, self.version, self.table.version)
+            table = window_tables.get(key)
+            if table is None:
+                counts, totals = self.window_totals(gte, lte, prison, category)
+                columns = collections.OrderedDict(
+                    (name, column)
+                    for name, column in self.table.columns.items()
+                    if not isinstance(column, RowIdColumn)
+                )
+                columns[self.count_name] = IntegerColumn(counts)
+                columns[self.total_name] = IntegerColumn(totals)
+                table = Table(columns, reverse_order=self.table.reverse_order)
+                table.indexes = dict(self.table.indexes)
+                table.orderings = {
+                    ordering: permutation
+                    for ordering, permutation in self.table.orderings.items()
+                    if ordering.lstrip('-') not in (self.count_name, self.total_name)
+                }
+                window_tables.set(key, table)
+            return table
+
+
+prisoner_credit_cube = AggregateCube(credits_list, prisoner_list, 'prisoner_id', 'received_at', 'source',
+                                     'credit_count', 'credit_total')
+sender_credit_cube = AggregateCube(credits_list, sender_list, 'sender_id', 'received_at', 'source',
+                                   'credit_count', 'credit_total')
+prisoner_disbursement_cube = AggregateCube(disbursement_list, prisoner_list, 'prisoner_id', 'created', 'method',
+                                           'disbursement_count', 'disbursement_total')
+cubes = [prisoner_credit_cube, sender_credit_cube, prisoner_disbursement_cube]
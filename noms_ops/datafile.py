@@ -0,0 +1,233 @@
+import array
+import collections
+import json
+import mmap
+import struct
+import sys
+
+from noms_ops.indexes import HashIndex, MappedPostings, Permutation, SortedIndex, TrigramIndex
+from noms_ops.store import Table, CategoryColumn, CategorySetColumn, DateTimeColumn, ForeignKeyColumn, \
+    IntegerColumn, PackedStrings, RowIdColumn, StringColumn
+
+# a dataset file holds built tables with their indexes and orderings so that they are used in place once mapped:
+# a magic number, the size of a JSON header describing every table, the header, then 8-byte aligned sections of
+# fixed-width column values, string heaps with their offsets and index postings, in native byte order
+MAGIC = b'NOMSOPS\x00'
+VERSION = 1
+ALIGNMENT = 8
+column_types = {
+    column_type.__name__: column_type
+    for column_type in (IntegerColumn, ForeignKeyColumn, DateTimeColumn, CategoryColumn, CategorySetColumn,
+                        StringColumn)
+}
+
+
+def aligned(size):
+    return size + -size % ALIGNMENT
+
+
+def restore(cls, **attributes):
+    # an object that was built before it was written, without building it again
+    obj = cls.__new__(cls)
+    obj.__dict__.update(attributes)
+    return obj
+
+
+class DatasetFileWriter:
+    def __init__(self, tables):
+        self.tables = tables
+        self.sections = []
+        self.size = 0
+
+    def add(self, data):
+        # returns the offset and size of a section from the end of the header
+        offset = self.size
+        self.sections.append(data)
+        padding = aligned(len(data)) - len(data)
+        if padding:
+            self.sections.append(bytes(padding))
+        self.size += len(data) + padding
+        return [offset, len(data)]
+
+    def add_array(self, values):
+        typecode = getattr(values, 'typecode', None) or values.format
+        return self.add(values.tobytes()) + [typecode]
+
+    def add_strings(self, values):
+        if not isinstance(values, PackedStrings):
+            values = PackedStrings(values)
+        return {'buffer': self.add(bytes(values.buffer)), 'offsets': self.add_array(values.offsets)}
+
+    def add_postings(self, postings, keys):
+        # `keys` are the sorted keys of `postings` as they are written
+        offsets, row_ids = array.array('q', [0]), array.array('i')
+        for key in sorted(postings):
+            row_ids.extend(postings[key])
+            offsets.append(len(row_ids))
+        return {'keys': keys, 'offsets': self.add_array(offsets), 'row_ids': self.add_array(row_ids)}
+
+    def describe_column(self, name, column):
+        description = {'name': name, 'type': column.__class__.__name__}
+        if isinstance(column, StringColumn):
+            description['values'] = self.add_strings(column.values)
+        else:
+            description['values'] = self.add_array(column.values)
+        if isinstance(column, (CategoryColumn, CategorySetColumn)):
+            description['categories'] = column.categories
+        return description
+
+    def describe_index(self, key, index):
+        if isinstance(index, HashIndex):
+            postings = index.postings if isinstance(index.postings, dict) else index.postings.thaw()
+            if isinstance(index.column, CategoryColumn):
+                postings = {index.column.codes[category]: row_ids for category, row_ids in postings.items()}
+                keys = self.add_array(array.array('q', sorted(postings)))
+            elif isinstance(index.column, StringColumn):
+                keys = self.add_strings(sorted(postings))
+            else:
+                keys = self.add_array(array.array('q', sorted(postings)))
+            return {'type': 'HashIndex', 'key': key, 'postings': self.add_postings(postings, keys)}
+        if isinstance(index, SortedIndex):
+            description = {'type': 'SortedIndex', 'key': key, 'order': None, 'keys': None}
+            if index.order is not None:
+                description['order'] = self.add_array(index.order)
+                description['keys'] = self.add_array(index.keys)
+            return description
+        if isinstance(index, TrigramIndex):
+            postings = index.postings if isinstance(index.postings, dict) else index.postings.thaw()
+            return {
+                'type': 'TrigramIndex', 'key': list(key), 'values': self.add_strings(index.values),
+                'postings': self.add_postings(postings, self.add_strings(sorted(postings))),
+            }
+        raise TypeError('Cannot write %s indexes' % index.__class__.__name__)
+
+    def describe_table(self, table):
+        references = collections.OrderedDict()
+        for name, column in table.references.items():
+            references.setdefault((column.key, self.tables.index(column.table)), []).append(name)
+        return {
+            'reverse_order': table.reverse_order,
+            'columns': [
+                self.describe_column(name, column)
+                for name, column in table.columns.items()
+                if not isinstance(column, RowIdColumn)
+            ],
+            'references': [[key, referenced, names] for (key, referenced), names in references.items()],
+            'indexes': [self.describe_index(key, index) for key, index in table.indexes.items()],
+            'orderings': [
+                {'key': key, 'name': key.lstrip('-'), 'descending': ordering.descending,
+                 'order': self.add_array(ordering.order)}
+                for key, ordering in table.orderings.items()
+            ],
+        }
+
+
+def write_dataset_file(path, prisoners, senders, recipients, credits, disbursements, current_prisoners):
+    tables = [prisoners, senders, recipients, credits, disbursements]
+    writer = DatasetFileWriter(tables)
+    header = json.dumps({
+        'version': VERSION,
+        'byteorder': sys.byteorder,
+        'tables': [writer.describe_table(table) for table in tables],
+        'current_prisoners': writer.add_strings(sorted(current_prisoners)),
+    }).encode()
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(bytes(aligned(f.tell()) - f.tell()))
+        for section in writer.sections:
+            f.write(section)
+
+
+class DatasetFileReader:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # pages are shared with other processes mapping the file until written to, e.g. when totals are updated
+            self.data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a dataset file' % path)
+        header_size, = struct.unpack('<Q', self.data[len(MAGIC):len(MAGIC) + 8])
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.data[header_start:header_start + header_size]).decode())
+        if self.header['version'] != VERSION or self.header['byteorder'] != sys.byteorder:
+            raise ValueError('Dataset file %s has an unsupported version or byte order' % path)
+        self.start = aligned(header_start + header_size)
+
+    def section(self, description):
+        offset, size = description[:2]
+        section = self.data[self.start + offset:self.start + offset + size]
+        if len(description) > 2:
+            section = section.cast(description[2])
+        return section
+
+    def strings(self, description):
+        return restore(PackedStrings, buffer=self.section(description['buffer']),
+                       offsets=self.section(description['offsets']))
+
+    def postings(self, description, keys, **kwargs):
+        return MappedPostings(keys, self.section(description['offsets']), self.section(description['row_ids']),
+                              **kwargs)
+
+    def column(self, description):
+        column_type = column_types[description['type']]
+        if column_type is StringColumn:
+            return restore(column_type, values=self.strings(description['values']))
+        column = restore(column_type, values=self.section(description['values']))
+        if 'categories' in description:
+            column.categories = description['categories']
+            column.codes = {category: code for code, category in enumerate(column.categories)}
+        return column
+
+    def index(self, table, description):
+        if description['type'] == 'HashIndex':
+            column = table.columns[description['key']]
+            postings = description['postings']
+            if isinstance(column, CategoryColumn):
+                return restore(HashIndex, column=column, postings=self.postings(
+                    postings, self.section(postings['keys']),
+                    encode=column.codes.get, decode=column.categories.__getitem__,
+                ))
+            if isinstance(column, StringColumn):
+                keys = self.strings(postings['keys'])
+            else:
+                keys = self.section(postings['keys'])
+            return restore(HashIndex, column=column, postings=self.postings(postings, keys))
+        if description['type'] == 'SortedIndex':
+            column = table.columns[description['key']]
+            if description['order'] is None:
+                return restore(SortedIndex, column=column, order=None, keys=column.values)
+            return restore(SortedIndex, column=column, order=self.section(description['order']),
+                           keys=self.section(description['keys']))
+        postings = description['postings']
+        return restore(
+            TrigramIndex, columns=tuple(table.columns[name] for name in description['key']),
+            values=self.strings(description['values']),
+            postings=self.postings(postings, self.strings(postings['keys'])),
+        )
+
+    def tables(self):
+        tables = []
+        for description in self.header['tables']:
+            table = Table(
+                collections.OrderedDict(
+                    (column['name'], self.column(column)) for column in description['columns']
+                ),
+                references=[(key, tables[referenced], names) for key, referenced, names in description['references']],
+                reverse_order=description['reverse_order'],
+            )
+            for index in description['indexes']:
+                key = index['key']
+                table.indexes[tuple(key) if isinstance(key, list) else key] = self.index(table, index)
+            for ordering in description['orderings']:
+                table.orderings[ordering['key']] = Permutation(
+                    table, ordering['name'], ordering['descending'], self.section(ordering['order']),
+                )
+            tables.append(table)
+        current_prisoners = set(self.strings(self.header['current_prisoners']))
+        return tuple(tables) + (current_prisoners,)
+
+
+def map_dataset_file(path):
+    # returns tables in the same way as build_tables, using the mapped file in place
+    return DatasetFileReader(path).tables()
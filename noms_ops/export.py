@@ -0,0 +1,100 @@
+import csv
+import datetime
+import io
+import itertools
+import json
+import sys
+
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from noms_ops.cache import LRUCache
+from noms_ops.store import ForeignKeyColumn, RowIdColumn
+
+# rows encoded together in each chunk of a streamed response
+CHUNK_SIZE = 1000
+
+
+def export_names(table):
+    # columns that are useful outside the prototype, i.e. not internal row ids
+    return [
+        name for name in table.keys
+        if not isinstance(table.column(name), (ForeignKeyColumn, RowIdColumn))
+    ]
+
+
+def chunked_values(table, names, row_ids):
+    # lists of row values, CHUNK_SIZE rows at a time, read straight from columns without creating rows
+    columns = [table.column(name) for name in names]
+    row_ids = iter(row_ids)
+    while True:
+        chunk = list(itertools.islice(row_ids, CHUNK_SIZE))
+        if not chunk:
+            break
+        yield [[column[row_id] for column in columns] for row_id in chunk]
+
+
+def encode_csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    return value
+
+
+def csv_chunks(table, names, row_ids):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in chunked_values(table, names, row_ids):
+        writer.writerows([list(map(encode_csv_value, values)) for values in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+encode_json = json.JSONEncoder(default=encode_json_value).encode
+
+# as in django's json_script, so that encoded strings cannot close the HTML comment or element they are written in
+json_html_escapes = {ord('<'): '\\u003C', ord('>'): '\\u003E', ord('&'): '\\u0026'}
+
+
+def encode_html_safe_json(value):
+    return mark_safe(encode_json(value).translate(json_html_escapes))
+
+
+def json_lines_chunks(table, names, row_ids):
+    for rows in chunked_values(table, names, row_ids):
+        yield ''.join('%s\n' % encode_json(dict(zip(names, values))) for values in rows)
+
+
+# JSON encoding of whole rows as safe strings keyed on the table's id, row id and the version in which the row last
+# changed, limited by memory used; the columns that rows refer to in other tables never change
+row_json_cache = LRUCache(settings.NOMS_OPS_ROW_CACHE_SIZE, sizeof=sys.getsizeof)
+
+
+def json_row(table, row_id):
+    # a row encoded with all its columns, reusing the encoding of unchanged rows
+    key = (table.cache_id, row_id, table.row_versions.get(row_id, 0))
+    encoded_row = row_json_cache.get(key)
+    if encoded_row is None:
+        encoded_row = encode_html_safe_json(dict(zip(table.keys, (table.column(name)[row_id] for name in table.keys))))
+        row_json_cache.set(key, encoded_row)
+    return encoded_row
+
+
+def json_rows(table, row_ids):
+    return [json_row(table, row_id) for row_id in row_ids]
+
+
+# content type and encoder of each export format
+export_formats = {
+    'csv': ('text/csv', csv_chunks),
+    'jsonl': ('application/x-ndjson', json_lines_chunks),
+}
@@ -8,9 +8,13 @@ from django.utils.dateformat import format as format_date
 from govuk_forms.fields import SplitDateField
 from govuk_forms.forms import GOVUKForm
 
+from noms_ops.cube import prisoner_credit_cube, prisoner_disbursement_cube, sender_credit_cube
+from noms_ops.graph import credit_graph, disbursement_graph
 from noms_ops.models import AmountPattern, prisons, sources, methods, \
-    credit_statuses, disbursement_statuses, \
-    sender_list, prisoner_list, current_prisoner_list, \
+    credit_statuses, disbursement_statuses
+from noms_ops.query import FilterPlan, FilterResults, AmountMatches, Contains, DateRange, Equals, GreaterThan, \
+    HasCategory, InRows, InSet
+from noms_ops.tables import sender_list, prisoner_list, current_prisoner_list, \
     credits_list, disbursement_list
 from noms_ops.templatetags.noms_ops import currency
 
@@ -43,16 +47,64 @@ def validate_prisoner_number(prisoner_number):
         raise ValidationError('Invalid prisoner number', code='invalid')
 
 
-class StopFiltering(Exception):
-    pass
+def find_prisoners(prisoner_number):
+    return prisoner_list.indexes['prisoner_number'].lookup(prisoner_number)
+
+
+def find_senders(sender_name):
+    # payment sources named exactly `sender_name` ignoring case, found among those whose names contain it
+    sender_name = sender_name.upper()
+    index = sender_list.indexes[('sender_name',)]
+    return [row_id for row_id in index.search(sender_name) if index.values[row_id] == sender_name]
+
+
+def describe_date_range(query_data, get_query, descriptions, verb, gte_name, lt_name):
+    gte = query_data.get(gte_name)
+    lt = query_data.get(lt_name)
+    if gte or lt:
+        if gte and lt:
+            label = '%s between %s and %s' % (verb, format_date(gte, 'j N Y'), format_date(lt, 'j N Y'))
+        elif gte:
+            label = '%s since %s' % (verb, format_date(gte, 'j N Y'))
+        else:
+            label = '%s before %s' % (verb, format_date(lt, 'j N Y'))
+        descriptions.append((
+            label,
+            get_query(gte_name, lt_name)
+        ))
+    return {gte_name, lt_name}
 
 
 class FilterForm(GOVUKForm):
     auto_replace_widgets = True
     object_source = []
+    # fields that choose how results are presented rather than which are included
+    presentation_fields = {'ordering', 'page', 'page_size'}
+
+    page = forms.IntegerField(label='Page', min_value=1, required=False)
+    page_size = forms.IntegerField(label='Results per page', min_value=1, max_value=1000, required=False)
+
+    # `perform_filter__*` and `describe_filter__*` methods, collected in name order when each form class is created
+    filter_hooks = ()
+    description_hooks = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.filter_hooks = cls.find_hooks('perform_filter__')
+        cls.description_hooks = cls.find_hooks('describe_filter__')
+
+    @classmethod
+    def find_hooks(cls, prefix):
+        hooks = (getattr(cls, name) for name in sorted(dir(cls)) if name.startswith(prefix))
+        return tuple(hook for hook in hooks if callable(hook))
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # counts how often query data is used and built while rendering a page
+        self.query_data_uses = 0
+        self.query_data_builds = 0
+        # otherwise ordered by the field's initial value, which is filled into the data below
+        self.ordering_chosen = bool(self.is_bound and self.data.get('ordering'))
         if self.is_bound:
             data = {
                 name: field.initial
@@ -71,41 +123,76 @@ class FilterForm(GOVUKForm):
                 })
             self.data = data
 
+    @property
+    def query_data(self):
+        # built once the form is cleaned and shared by everything rendering the page, so must not be changed
+        self.query_data_uses += 1
+        if not hasattr(self, '_query_data'):
+            self.query_data_builds += 1
+            data = collections.OrderedDict()
+            for field in self:
+                value = self.cleaned_data.get(field.name)
+                if value in [None, '', []]:
+                    continue
+                data[field.name] = value
+            self._query_data = data
+        return self._query_data
+
     def get_query_data(self):
-        data = collections.OrderedDict()
-        for field in self:
-            value = self.cleaned_data.get(field.name)
-            if value in [None, '', []]:
-                continue
-            data[field.name] = value
-        return data
+        return collections.OrderedDict(self.query_data)
+
+    def get_query_string(self, exclude=(), **replacements):
+        # urlencoded query data without `exclude`d fields and with `replacements`, kept for reuse within the request
+        if not hasattr(self, '_query_strings'):
+            self._query_strings = {}
+        key = (tuple(exclude), tuple(sorted(replacements.items())))
+        query_string = self._query_strings.get(key)
+        if query_string is None:
+            data = collections.OrderedDict(
+                (name, value)
+                for name, value in self.query_data.items()
+                if name not in exclude
+            )
+            data.update(replacements)
+            query_string = self._query_strings[key] = urlencode(data, doseq=True)
+        return query_string
+
+    def get_cache_key(self):
+        # the filters applied in a canonical order, ignoring ordering and paging
+        return (self.__class__.__name__,) + tuple(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in sorted(self.query_data.items())
+            if name not in self.presentation_fields
+        )
+
+    @property
+    def selected_sections(self):
+        if not hasattr(self, '_selected_sections'):
+            query_data = self.query_data
+            self._selected_sections = {
+                section: any(query_data.get(field) for field in fields)
+                for section, fields in self.sections.items()
+            }
+        return self._selected_sections
 
     def is_section_selected(self, section):
-        query_data = self.get_query_data()
-        return any(query_data.get(field) for field in self.sections.get(section))
+        return self.selected_sections[section]
 
     @property
     def is_filtered(self):
-        return any(value for key, value in self.get_query_data().items() if key != 'ordering')
+        return any(value for key, value in self.query_data.items() if key not in self.presentation_fields)
 
     @property
     def filter_descriptions(self):
-        query_data = self.get_query_data()
+        query_data = self.query_data
         descriptions = []
-        described_fields = {'ordering'}
+        described_fields = set(self.presentation_fields)
 
         def get_query(*excluded_fields):
-            return urlencode([
-                (key, value)
-                for key, value in query_data.items()
-                if key not in excluded_fields
-            ], doseq=True)
-
-        for method in filter(lambda attr: attr.startswith('describe_filter__'), dir(self)):
-            method = getattr(self, method)
-            if not callable(method):
-                continue
-            described_fields.update(method(query_data, get_query, descriptions))
+            return self.get_query_string(exclude=excluded_fields + ('page',))
+
+        for hook in self.description_hooks:
+            described_fields.update(hook(self, query_data, get_query, descriptions))
 
         return descriptions + [
             (
@@ -116,45 +203,43 @@ class FilterForm(GOVUKForm):
             if field.name not in described_fields and field.name in query_data
         ]
 
+    def get_filter_plan(self):
+        if hasattr(self, '_filter_plan'):
+            return self._filter_plan
+
+        query_data = self.query_data
+        plan = FilterPlan(self.object_source, cache_key=self.get_cache_key())
+        filtered_fields = set(self.presentation_fields)
+        for hook in self.filter_hooks:
+            filtered_fields.update(hook(self, query_data, plan))
+
+        for field in self.fields:
+            if field in filtered_fields:
+                continue
+            value = query_data.get(field)
+            if not value:
+                continue
+            plan.add(Equals(field, value))
+
+        self._filter_plan = plan
+        return plan
+
+    def get_ordering(self):
+        return self.cleaned_data.get('ordering') or self['ordering'].initial
+
     @property
     def object_list(self):
         if not self.is_valid():
             return []
 
-        query_data = self.get_query_data()
-        ordering = query_data.pop('ordering', '') or self['ordering'].initial
-        if ordering.startswith('-'):
-            reverse = True
-            ordering = ordering[1:]
-        else:
-            reverse = False
-
-        object_filters = []
-        for method in filter(lambda attr: attr.startswith('perform_filter__'), dir(self)):
-            method = getattr(self, method)
-            if callable(method):
-                object_filters.append(method)
-
-        def compare(obj):
-            filtered_fields = {'ordering'}
-            for object_filter in object_filters:
-                try:
-                    filtered_fields.update(object_filter(query_data, obj))
-                except StopFiltering:
-                    return False
-
-            for field in self.fields:
-                if field in filtered_fields:
-                    continue
-                value = query_data.get(field)
-                if not value:
-                    continue
-                if obj[field] != value:
-                    return False
+        return self.get_filter_plan().object_list(self.get_ordering())
 
-            return True
+    @property
+    def results(self):
+        if not self.is_valid():
+            return []
 
-        return sorted(filter(compare, self.object_source), key=lambda obj: obj[ordering], reverse=reverse)
+        return FilterResults(self.get_filter_plan(), self.get_ordering())
 
 
 class AmountMixin(FilterForm):
@@ -195,26 +280,14 @@ class AmountMixin(FilterForm):
             ))
         return {'amount_pattern', 'amount_exact', 'amount_pence'}
 
-    def perform_filter__amount(self, query_data, obj):
+    def perform_filter__amount(self, query_data, plan):
         amount_pattern = query_data.get('amount_pattern')
-        if amount_pattern == 'not_integral':
-            if not bool(obj['amount'] % 100):
-                raise StopFiltering
-        elif amount_pattern == 'not_multiple_5':
-            if str(obj['amount'])[-3:] in ('000', '500'):
-                raise StopFiltering
-        elif amount_pattern == 'not_multiple_10':
-            if str(obj['amount'])[-3:] == '000':
-                raise StopFiltering
-        elif amount_pattern == 'gte_100':
-            if obj['amount'] < 10000:
-                raise StopFiltering
-        elif amount_pattern == 'exact':
-            if obj['amount'] != parse_amount(query_data['amount_exact']):
-                raise StopFiltering
+        if amount_pattern == 'exact':
+            plan.add(AmountMatches('amount', amount_pattern, parse_amount(query_data['amount_exact'])))
         elif amount_pattern == 'pence':
-            if obj['amount'] % 100 != int(query_data['amount_pence']):
-                raise StopFiltering
+            plan.add(AmountMatches('amount', amount_pattern, int(query_data['amount_pence'])))
+        elif amount_pattern:
+            plan.add(AmountMatches('amount', amount_pattern))
         return {'amount_pattern', 'amount_exact', 'amount_pence'}
 
 
@@ -232,10 +305,10 @@ class PrisonerMixin(FilterForm):
             return prisoner_number.upper()
         return prisoner_number
 
-    def perform_filter__prisoner_name(self, query_data, obj):
+    def perform_filter__prisoner_name(self, query_data, plan):
         prisoner_name = query_data.get('prisoner_name')
-        if prisoner_name and (prisoner_name.upper() not in obj['prisoner_name'].upper()):
-            raise StopFiltering
+        if prisoner_name:
+            plan.add(Contains(['prisoner_name'], prisoner_name))
         return {'prisoner_name'}
 
     def describe_filter__current_serving(self, query_data, get_query, descriptions):
@@ -247,10 +320,10 @@ class PrisonerMixin(FilterForm):
             ))
         return {'current_serving'}
 
-    def perform_filter__current_serving(self, query_data, obj):
+    def perform_filter__current_serving(self, query_data, plan):
         current_serving = query_data.get('current_serving')
-        if current_serving and obj['prisoner_number'] not in current_prisoner_list:
-            raise StopFiltering
+        if current_serving:
+            plan.add(InSet('prisoner_number', current_prisoner_list))
         return {'current_serving'}
 
 
@@ -316,25 +389,54 @@ class SenderMixin(FilterForm):
             ))
         return {'source'}
 
-    def perform_filter__sender_name(self, query_data, obj):
+    def perform_filter__sender_name(self, query_data, plan):
         sender_name = query_data.get('sender_name')
-        if sender_name and (sender_name.upper() not in obj['sender_name'].upper()):
-            raise StopFiltering
+        if sender_name:
+            plan.add(Contains(['sender_name'], sender_name))
         return {'sender_name'}
 
-    def perform_filter__sender_email(self, query_data, obj):
+    def perform_filter__sender_email(self, query_data, plan):
         sender_email = query_data.get('sender_email')
-        if sender_email and (sender_email.upper() not in obj['sender_email'].upper()):
-            raise StopFiltering
+        if sender_email:
+            plan.add(Contains(['sender_email'], sender_email))
         return {'sender_email'}
 
-    def perform_filter__postcode(self, query_data, obj):
+    def perform_filter__postcode(self, query_data, plan):
         postcode = query_data.get('postcode')
-        if postcode and (postcode.upper() not in obj['postcode'].upper()):
-            raise StopFiltering
+        if postcode:
+            plan.add(Contains(['postcode'], postcode))
         return {'postcode'}
 
 
+class AggregateWindowMixin(FilterForm):
+    # prisoner or sender forms with a date window, within which counts and totals are found by summing the cells
+    # of an aggregate cube rather than walking credits or disbursements
+    cube = None
+    window_fields = ()
+    # set once cleaned with a window; other counts and totals, e.g. of prisoners or prisons, still cover all time
+    is_windowed = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        gte, lt = (cleaned_data.get(name) for name in self.window_fields)
+        if gte or lt:
+            self.is_windowed = True
+            self.object_source = self.cube.window_table(gte, lt, **self.get_window_dimensions(cleaned_data))
+            if not self.ordering_chosen:
+                # the default ordering would otherwise be by an all-time count, ignoring the window
+                cleaned_data['ordering'] = self.data['ordering'] = '-%s' % self.cube.count_name
+        return cleaned_data
+
+    def get_window_dimensions(self, cleaned_data):
+        return {}
+
+    def perform_filter__window(self, query_data, plan):
+        # only prisoners or senders with credits or disbursements within the window are included
+        if any(query_data.get(name) for name in self.window_fields):
+            plan.add(GreaterThan(self.cube.count_name, 0))
+        return set(self.window_fields)
+
+
 class CreditForm(AmountMixin, PrisonerMixin, PrisonMixin, SenderMixin, FilterForm):
     ordering = forms.ChoiceField(label='Order by', required=False,
                                  initial='-received_at',
@@ -376,31 +478,14 @@ class CreditForm(AmountMixin, PrisonerMixin, PrisonMixin, SenderMixin, FilterFor
     object_source = credits_list
 
     def describe_filter__received_at(self, query_data, get_query, descriptions):
-        received_at__gte = query_data.get('received_at__gte')
-        received_at__lt = query_data.get('received_at__lt')
-        if received_at__gte or received_at__lt:
-            if received_at__gte and received_at__lt:
-                label = 'Received between %s and %s' % (format_date(received_at__gte, 'j N Y'),
-                                                        format_date(received_at__lt, 'j N Y'))
-            elif received_at__gte:
-                label = 'Received since %s' % format_date(received_at__gte, 'j N Y')
-            else:
-                label = 'Received before %s' % format_date(received_at__lt, 'j N Y')
-            descriptions.append((
-                label,
-                get_query('received_at__gte', 'received_at__lt')
-            ))
-        return {'received_at__gte', 'received_at__lt'}
+        return describe_date_range(query_data, get_query, descriptions, 'Received', 'received_at__gte',
+                                   'received_at__lt')
 
-    def perform_filter__received_at(self, query_data, obj):
+    def perform_filter__received_at(self, query_data, plan):
         received_at__gte = query_data.get('received_at__gte')
         received_at__lt = query_data.get('received_at__lt')
-        if received_at__gte:
-            if obj['received_at'].date() < received_at__gte:
-                raise StopFiltering
-        if received_at__lt:
-            if obj['received_at'].date() > received_at__lt:
-                raise StopFiltering
+        if received_at__gte or received_at__lt:
+            plan.add(DateRange('received_at', received_at__gte, received_at__lt))
         return {'received_at__gte', 'received_at__lt'}
 
     def describe_filter__status(self, query_data, get_query, descriptions):
@@ -413,7 +498,7 @@ class CreditForm(AmountMixin, PrisonerMixin, PrisonMixin, SenderMixin, FilterFor
         return {'status'}
 
 
-class SenderForm(PrisonMixin, SenderMixin, FilterForm):
+class SenderForm(AggregateWindowMixin, PrisonMixin, SenderMixin, FilterForm):
     ordering = forms.ChoiceField(label='Order by', required=False,
                                  initial='-prisoner_count',
                                  choices=[
@@ -427,24 +512,56 @@ class SenderForm(PrisonMixin, SenderMixin, FilterForm):
                                      ('-credit_total', 'Total sent (high to low)'),
                                  ])
 
+    received_at__gte = SplitDateField(label='Sent since', help_text='for example 13/02/2018', required=False)
+    received_at__lt = SplitDateField(label='Sent before', help_text='for example 13/02/2018', required=False)
+
+    prisoner_number = forms.CharField(label='Sent to prisoner number', validators=[validate_prisoner_number],
+                                      required=False)
+    shares_prisoners_with = forms.CharField(label='Shares prisoners with sender name', required=False)
+
     sections = {
+        'date': ('received_at__gte', 'received_at__lt'),
         'source': (
             'source', 'sender_name',
             'sender_sort_code', 'sender_account_number', 'sender_roll_number',
             'card_number_last_digits', 'sender_email', 'postcode', 'ip_address',
         ),
         'prison': ('prison', 'prison_region', 'prison_population', 'prison_category'),
+        'network': ('prisoner_number', 'shares_prisoners_with'),
     }
 
     object_source = sender_list
+    cube = sender_credit_cube
+    window_fields = ('received_at__gte', 'received_at__lt')
+
+    def get_window_dimensions(self, cleaned_data):
+        # only credits sent to the chosen prison within the window are counted
+        return {'prison': cleaned_data.get('prison')}
+
+    def describe_filter__received_at(self, query_data, get_query, descriptions):
+        return describe_date_range(query_data, get_query, descriptions, 'Sent', 'received_at__gte', 'received_at__lt')
+
+    def clean_prisoner_number(self):
+        prisoner_number = self.cleaned_data.get('prisoner_number')
+        if prisoner_number:
+            return prisoner_number.upper()
+        return prisoner_number
 
-    def perform_filter__prison(self, query_data, obj):
+    def perform_filter__prison(self, query_data, plan):
         prison = query_data.get('prison')
         if prison:
-            if prison not in obj['prisons']:
-                raise StopFiltering
+            plan.add(HasCategory('prisons', prison))
         return {'prison'}
 
+    def perform_filter__network(self, query_data, plan):
+        prisoner_number = query_data.get('prisoner_number')
+        if prisoner_number:
+            plan.add(InRows(credit_graph.reverse_neighbours(find_prisoners(prisoner_number))))
+        shares_prisoners_with = query_data.get('shares_prisoners_with')
+        if shares_prisoners_with:
+            plan.add(InRows(credit_graph.two_hop(find_senders(shares_prisoners_with))))
+        return {'prisoner_number', 'shares_prisoners_with'}
+
 
 class PrisonerForm(PrisonerMixin, PrisonMixin, FilterForm):
     ordering = forms.ChoiceField(label='Order by', required=False,
@@ -466,13 +583,61 @@ class PrisonerForm(PrisonerMixin, PrisonMixin, FilterForm):
                                      ('-prisoner_number', 'Prisoner number (Z to A)'),
                                  ])
 
+    shares_senders_with = forms.CharField(label='Shares payment sources with prisoner number',
+                                          validators=[validate_prisoner_number], required=False)
+    shares_recipients_with = forms.CharField(label='Shares recipients with prisoner number',
+                                             validators=[validate_prisoner_number], required=False)
+
     sections = {
         'prisoner': ('prisoner_number', 'prisoner_name', 'current_serving'),
         'prison': ('prison', 'prison_region', 'prison_population', 'prison_category'),
+        'network': ('shares_senders_with', 'shares_recipients_with'),
     }
 
     object_source = prisoner_list
 
+    def clean_shares_senders_with(self):
+        return self.cleaned_data.get('shares_senders_with').upper()
+
+    def clean_shares_recipients_with(self):
+        return self.cleaned_data.get('shares_recipients_with').upper()
+
+    def perform_filter__network(self, query_data, plan):
+        shares_senders_with = query_data.get('shares_senders_with')
+        if shares_senders_with:
+            plan.add(InRows(credit_graph.reverse_two_hop(find_prisoners(shares_senders_with))))
+        shares_recipients_with = query_data.get('shares_recipients_with')
+        if shares_recipients_with:
+            plan.add(InRows(disbursement_graph.two_hop(find_prisoners(shares_recipients_with))))
+        return {'shares_senders_with', 'shares_recipients_with'}
+
+
+class PrisonerCreditForm(AggregateWindowMixin, PrisonerForm):
+    received_at__gte = SplitDateField(label='Received since', help_text='for example 13/02/2018', required=False)
+    received_at__lt = SplitDateField(label='Received before', help_text='for example 13/02/2018', required=False)
+
+    sections = dict(PrisonerForm.sections, date=('received_at__gte', 'received_at__lt'))
+
+    cube = prisoner_credit_cube
+    window_fields = ('received_at__gte', 'received_at__lt')
+
+    def describe_filter__received_at(self, query_data, get_query, descriptions):
+        return describe_date_range(query_data, get_query, descriptions, 'Received', 'received_at__gte',
+                                   'received_at__lt')
+
+
+class PrisonerDisbursementForm(AggregateWindowMixin, PrisonerForm):
+    created__gte = SplitDateField(label='Entered since', help_text='for example 13/02/2018', required=False)
+    created__lt = SplitDateField(label='Entered before', help_text='for example 13/02/2018', required=False)
+
+    sections = dict(PrisonerForm.sections, date=('created__gte', 'created__lt'))
+
+    cube = prisoner_disbursement_cube
+    window_fields = ('created__gte', 'created__lt')
+
+    def describe_filter__created(self, query_data, get_query, descriptions):
+        return describe_date_range(query_data, get_query, descriptions, 'Entered', 'created__gte', 'created__lt')
+
 
 class DisbursementForm(AmountMixin, PrisonerMixin, PrisonMixin, FilterForm):
     ordering = forms.ChoiceField(label='Order by', required=False,
@@ -539,31 +704,13 @@ class DisbursementForm(AmountMixin, PrisonerMixin, PrisonMixin, FilterForm):
         return self.cleaned_data.get('roll_number')
 
     def describe_filter__created(self, query_data, get_query, descriptions):
-        created__gte = query_data.get('created__gte')
-        created__lt = query_data.get('created__lt')
-        if created__gte or created__lt:
-            if created__gte and created__lt:
-                label = 'Entered between %s and %s' % (format_date(created__gte, 'j N Y'),
-                                                       format_date(created__lt, 'j N Y'))
-            elif created__gte:
-                label = 'Entered since %s' % format_date(created__gte, 'j N Y')
-            else:
-                label = 'Entered before %s' % format_date(created__lt, 'j N Y')
-            descriptions.append((
-                label,
-                get_query('created__gte', 'created__lt')
-            ))
-        return {'created__gte', 'created__lt'}
+        return describe_date_range(query_data, get_query, descriptions, 'Entered', 'created__gte', 'created__lt')
 
-    def perform_filter__created(self, query_data, obj):
+    def perform_filter__created(self, query_data, plan):
         created__gte = query_data.get('created__gte')
         created__lt = query_data.get('created__lt')
-        if created__gte:
-            if obj['created'].date() < created__gte:
-                raise StopFiltering
-        if created__lt:
-            if obj['created'].date() > created__lt:
-                raise StopFiltering
+        if created__gte or created__lt:
+            plan.add(DateRange('created', created__gte, created__lt))
         return {'created__gte', 'created__lt'}
 
     def describe_filter__status(self, query_data, get_query, descriptions):
@@ -584,22 +731,20 @@ class DisbursementForm(AmountMixin, PrisonerMixin, PrisonMixin, FilterForm):
             ))
         return {'method'}
 
-    def perform_filter__sender_name(self, query_data, obj):
+    def perform_filter__sender_name(self, query_data, plan):
         recipient_name = query_data.get('recipient_name')
-        if recipient_name and (recipient_name.upper() not in (
-            obj['recipient_first_name'] + obj['recipient_last_name']
-        ).upper()):
-            raise StopFiltering
+        if recipient_name:
+            plan.add(Contains(['recipient_first_name', 'recipient_last_name'], recipient_name))
         return {'recipient_name'}
 
-    def perform_filter__recipient_email(self, query_data, obj):
+    def perform_filter__recipient_email(self, query_data, plan):
         recipient_email = query_data.get('recipient_email')
-        if recipient_email and (recipient_email.upper() not in obj['recipient_email'].upper()):
-            raise StopFiltering
+        if recipient_email:
+            plan.add(Contains(['recipient_email'], recipient_email))
         return {'recipient_email'}
 
-    def perform_filter__postcode(self, query_data, obj):
+    def perform_filter__postcode(self, query_data, plan):
         postcode = query_data.get('postcode')
-        if postcode and (postcode.upper() not in obj['postcode'].upper()):
-            raise StopFiltering
+        if postcode:
+            plan.add(Contains(['postcode'], postcode))
         return {'postcode'}
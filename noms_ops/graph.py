@@ -0,0 +1,202 @@
+import array
+import threading
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from noms_ops.startup import timed
+from noms_ops.tables import prisoner_list, sender_list, recipient_list, credits_list, disbursement_list
+
+empty_neighbours = array.array('i')
+
+
+def distinct(values):
+    # ascending distinct values of a numpy array; sorting and comparing neighbours is faster than numpy.unique here
+    values = numpy.sort(values)
+    if len(values):
+        values = values[numpy.append(True, values[1:] != values[:-1])]
+    return values
+
+
+def use_numpy():
+    return numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy'
+
+
+# fewer nodes are looked up in Python as vectorising has a fixed cost
+NUMPY_THRESHOLD = 64
+
+
+class Adjacency:
+    # compressed sparse rows: the ascending neighbours of node n are `targets[offsets[n]:offsets[n + 1]]`;
+    # edges added later, including those of nodes added later, are kept apart in `added`
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        self.added = {}
+
+    def __len__(self):
+        return len(self.targets) + sum(map(len, self.added.values()))
+
+    @classmethod
+    def from_edges(cls, nodes, neighbours, size):
+        # `nodes` and `neighbours` hold distinct edges ordered by node then neighbour, as lists or numpy arrays
+        if numpy is not None and isinstance(nodes, numpy.ndarray):
+            offsets = numpy.zeros(size + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(nodes, minlength=size), out=offsets[1:])
+            return cls(array.array('q', offsets.tobytes()), array.array('i', neighbours.astype(numpy.int32).tobytes()))
+        offsets = array.array('q', bytes(8 * (size + 1)))
+        for node in nodes:
+            offsets[node + 1] += 1
+        for node in range(size):
+            offsets[node + 1] += offsets[node]
+        return cls(offsets, array.array('i', neighbours))
+
+    def neighbours(self, node):
+        if node + 1 < len(self.offsets):
+            neighbours = self.targets[self.offsets[node]:self.offsets[node + 1]]
+        else:
+            neighbours = empty_neighbours
+        added = self.added.get(node)
+        if added:
+            neighbours = neighbours + added
+        return neighbours
+
+    def gather(self, nodes):
+        # the ascending distinct neighbours of any of `nodes`
+        if len(nodes) < NUMPY_THRESHOLD or not use_numpy():
+            found = set()
+            for node in nodes:
+                found.update(self.neighbours(node))
+            return array.array('i', sorted(found))
+        nodes = numpy.asarray(nodes, dtype=numpy.int64)
+        offsets = numpy.asarray(self.offsets)
+        stored = nodes[nodes < len(offsets) - 1]
+        starts = offsets[stored]
+        lengths = offsets[stored + 1] - starts
+        # positions of every neighbour of each node, one run of consecutive positions per node
+        positions = numpy.arange(lengths.sum()) + numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+        found = [numpy.asarray(self.targets)[positions]]
+        if self.added:
+            found.extend(numpy.asarray(self.added[node]) for node in nodes.tolist() if node in self.added)
+        return array.array('i', distinct(numpy.concatenate(found)).astype(numpy.int32).tobytes())
+
+    def degrees(self, size):
+        # the number of neighbours of each of `size` nodes
+        stored = max(min(size, len(self.offsets) - 1), 0)
+        if use_numpy():
+            degrees = numpy.zeros(size, dtype=numpy.int64)
+            degrees[:stored] = numpy.diff(numpy.asarray(self.offsets)[:stored + 1])
+            degrees = array.array('q', degrees.tobytes())
+        else:
+            offsets = self.offsets
+            degrees = array.array('q', (offsets[node + 1] - offsets[node] for node in range(stored)))
+            degrees.extend(0 for _ in range(size - stored))
+        for node, neighbours in self.added.items():
+            if node < size:
+                degrees[node] += len(neighbours)
+        return degrees
+
+    def add(self, node, neighbour):
+        neighbours = self.added.get(node)
+        if neighbours is None:
+            neighbours = self.added[node] = array.array('i')
+        neighbours.append(neighbour)
+
+
+def excluding(found, nodes):
+    nodes = set(nodes)
+    return array.array('i', (node for node in found if node not in nodes))
+
+
+class CounterpartyGraph:
+    # the distinct pairs of rows linked by credits or disbursements, e.g. senders and the prisoners they have paid,
+    # held as adjacency in both directions so that neighbours and nodes two hops away are found from the rows
+    # linked to each node rather than by walking credits or disbursements; all queries take sequences of row ids
+    # and return ascending row ids; built when first used and updated in place as rows are ingested
+    def __init__(self, facts, key, table, other_key, other_table):
+        self.facts = facts
+        self.key = key
+        self.table = table
+        self.other_key = other_key
+        self.other_table = other_table
+        self.forward = None
+        self.backward = None
+        # held while edges are added and while numpy views of adjacency exist as arrays cannot grow while viewed
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        self.build()
+        return len(self.forward)
+
+    def __repr__(self):
+        return '<%s: %s to %s>' % (self.__class__.__name__, self.key, self.other_key)
+
+    def build(self):
+        with self.lock:
+            if self.forward is not None:
+                return
+            with timed('build counterparty graphs'):
+                self.backward = self.build_adjacency(self.other_key, self.key, len(self.other_table), len(self.table))
+                # set last as it marks the graph as built
+                self.forward = self.build_adjacency(self.key, self.other_key, len(self.table), len(self.other_table))
+
+    def build_adjacency(self, key, other_key, size, other_size):
+        columns = self.facts.columns
+        if use_numpy():
+            with self.facts.lock:
+                nodes = numpy.asarray(columns[key].values).astype(numpy.int64)
+                edges = distinct(nodes * max(other_size, 1) + numpy.asarray(columns[other_key].values))
+            return Adjacency.from_edges(edges // max(other_size, 1), edges % max(other_size, 1), size)
+        edges = sorted(set(zip(columns[key].values, columns[other_key].values)))
+        return Adjacency.from_edges([node for node, _ in edges], [other_node for _, other_node in edges], size)
+
+    def add(self, node, other_node):
+        # adds an edge for a newly linked pair of rows; pairs linked before the graph is built are included when it is
+        with self.lock:
+            if self.forward is None:
+                return
+            self.forward.add(node, other_node)
+            self.backward.add(other_node, node)
+
+    def neighbours(self, nodes):
+        with self.lock:
+            self.build()
+            return self.forward.gather(nodes)
+
+    def reverse_neighbours(self, other_nodes):
+        with self.lock:
+            self.build()
+            return self.backward.gather(other_nodes)
+
+    def degrees(self):
+        # the number of distinct other nodes linked to each node, e.g. prisoners paid by each sender
+        with self.lock:
+            self.build()
+            return self.forward.degrees(len(self.table))
+
+    def reverse_degrees(self):
+        with self.lock:
+            self.build()
+            return self.backward.degrees(len(self.other_table))
+
+    def two_hop(self, nodes):
+        # nodes sharing a neighbour with any of `nodes`, e.g. senders paying the prisoners that a sender pays
+        with self.lock:
+            self.build()
+            return excluding(self.backward.gather(self.forward.gather(nodes)), nodes)
+
+    def reverse_two_hop(self, other_nodes):
+        # other nodes sharing a neighbour with any of `other_nodes`, e.g. prisoners sharing a sender with a prisoner
+        with self.lock:
+            self.build()
+            return excluding(self.forward.gather(self.backward.gather(other_nodes)), other_nodes)
+
+
+# senders and the prisoners they have sent credits to, and prisoners and the recipients of their disbursements
+credit_graph = CounterpartyGraph(credits_list, 'sender_id', sender_list, 'prisoner_id', prisoner_list)
+disbursement_graph = CounterpartyGraph(disbursement_list, 'prisoner_id', prisoner_list, 'recipient_id', recipient_list)
+graphs = [credit_graph, disbursement_graph]
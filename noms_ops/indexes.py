@@ -0,0 +1,245 @@
+import array
+import bisect
+import itertools
+
+from noms_ops.store import CategoryColumn, PackedStrings, growable
+
+empty_postings = array.array('i')
+
+
+class HashIndex:
+    # maps each value of a column to the ascending ids of rows holding it
+    def __init__(self, column):
+        self.column = column
+        postings = {}
+        for row_id, value in enumerate(column.values):
+            row_ids = postings.get(value)
+            if row_ids is None:
+                row_ids = postings[value] = array.array('i')
+            row_ids.append(row_id)
+        if isinstance(column, CategoryColumn):
+            postings = {column.categories[code]: row_ids for code, row_ids in postings.items()}
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.postings)
+
+    def lookup(self, value):
+        return self.postings.get(value, empty_postings)
+
+    def thaw(self):
+        if isinstance(self.postings, MappedPostings):
+            self.postings = self.postings.thaw()
+
+    def add(self, row_id):
+        value = self.column[row_id]
+        row_ids = self.postings.get(value)
+        if row_ids is None:
+            row_ids = self.postings[value] = array.array('i')
+        row_ids.append(row_id)
+
+
+class SortedIndex:
+    # finds the rows with values in a range by bisecting the sorted values of a column;
+    # columns that are already stored in order need no separate ordering of row ids
+    def __init__(self, column):
+        self.column = column
+        values = column.values
+        if all(values[row_id] <= values[row_id + 1] for row_id in range(len(values) - 1)):
+            self.order = None
+            self.keys = values
+        else:
+            self.order = array.array('i', sorted(range(len(values)), key=values.__getitem__))
+            self.keys = array.array(values.typecode, map(values.__getitem__, self.order))
+
+    def window(self, lower=None, upper=None):
+        # returns the range of positions with lower <= value < upper
+        return range(
+            0 if lower is None else bisect.bisect_left(self.keys, lower),
+            len(self.keys) if upper is None else bisect.bisect_left(self.keys, upper),
+        )
+
+    def thaw(self):
+        # called once the column has been thawed
+        if self.order is None:
+            self.keys = self.column.values
+        else:
+            self.order = growable(self.order)
+            self.keys = growable(self.keys)
+
+    def add(self, row_id):
+        values = self.column.values
+        if self.order is None:
+            if row_id == 0 or values[row_id - 1] <= values[row_id]:
+                # the added value is already at the end of the keys as they are the column's values
+                return
+            # rows are no longer stored in order so they need a separate ordering
+            self.order = array.array('i', range(row_id))
+            self.keys = array.array(values.typecode, values[:row_id])
+        position = bisect.bisect_right(self.keys, values[row_id])
+        self.keys.insert(position, values[row_id])
+        self.order.insert(position, row_id)
+
+
+class TrigramIndex:
+    # maps each sequence of 3 characters to the ascending ids of rows whose upper-cased values contain it,
+    # so that substring searches only check rows holding every trigram of the search text
+    size = 3
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.values = []
+        self.postings = {}
+        for row_id in range(len(columns[0])):
+            self.add(row_id)
+
+    def __len__(self):
+        return len(self.postings)
+
+    def add(self, row_id):
+        value = ''.join(column.values[row_id] for column in self.columns).upper()
+        self.values.append(value)
+        for trigram in set(value[start:start + self.size] for start in range(len(value) - self.size + 1)):
+            row_ids = self.postings.get(trigram)
+            if row_ids is None:
+                row_ids = self.postings[trigram] = array.array('i')
+            row_ids.append(row_id)
+
+    def freeze(self):
+        if not isinstance(self.values, PackedStrings):
+            self.values = PackedStrings(self.values)
+
+    def thaw(self):
+        if isinstance(self.values, PackedStrings):
+            self.values.thaw()
+        if isinstance(self.postings, MappedPostings):
+            self.postings = self.postings.thaw()
+
+    def search(self, text):
+        # returns the ascending ids of rows containing upper-cased `text`
+        values = self.values
+        if len(text) < self.size:
+            candidates = range(len(values))
+        else:
+            trigrams = set(text[start:start + self.size] for start in range(len(text) - self.size + 1))
+            postings = sorted((self.postings.get(trigram, empty_postings) for trigram in trigrams), key=len)
+            candidates = set(postings[0])
+            for row_ids in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(row_ids)
+            candidates = sorted(candidates)
+        return array.array('i', (row_id for row_id in candidates if text in values[row_id]))
+
+
+class MappedPostings:
+    # postings of an index read in place from a dataset file: the row ids of the ascending `keys` are stored
+    # end to end in `row_ids`, starting at `offsets`; `encode` optionally converts values to keys
+    def __init__(self, keys, offsets, row_ids, encode=None, decode=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.row_ids = row_ids
+        self.encode = encode
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, value, default=None):
+        if self.encode:
+            value = self.encode(value)
+            if value is None:
+                return default
+        position = bisect.bisect_left(self.keys, value)
+        if position == len(self.keys) or self.keys[position] != value:
+            return default
+        return self.row_ids[self.offsets[position]:self.offsets[position + 1]]
+
+    def thaw(self):
+        # a dict of growable postings for indexes that rows are added to
+        postings = {}
+        for position, key in enumerate(self.keys):
+            row_ids = array.array('i')
+            row_ids.frombytes(self.row_ids[self.offsets[position]:self.offsets[position + 1]].cast('B'))
+            postings[self.decode(key) if self.decode else key] = row_ids
+        return postings
+
+
+class Permutation:
+    # row ids in the order that stably sorting the table's natural order by a column gives,
+    # so a subset of rows is ordered by walking the permutation and keeping the rows in the subset
+    def __init__(self, table, name, descending, order):
+        self.column = table.column(name)
+        self.key = self.column.sort_key()
+        self.descending = descending
+        self.reverse_order = table.reverse_order
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def precedes(self, row_id, other_row_id):
+        key, other_key = self.key(row_id), self.key(other_row_id)
+        if key != other_key:
+            return key > other_key if self.descending else key < other_key
+        # rows with equal keys stay in natural order
+        return row_id > other_row_id if self.reverse_order else row_id < other_row_id
+
+    def add(self, row_id):
+        order = self.order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.precedes(order[middle], row_id):
+                low = middle + 1
+            else:
+                high = middle
+        order.insert(low, row_id)
+
+    def thaw(self):
+        # called once the column has been thawed, whose sort key may read the values it replaced
+        self.key = self.column.sort_key()
+        self.order = growable(self.order)
+
+    def move(self, row_id):
+        self.order.remove(row_id)
+        self.add(row_id)
+
+    def walk(self, row_ids, start=0, stop=None):
+        # iterates over the given rows in order, from `start` until `stop`
+        order = self.order
+        if len(row_ids) == len(order):
+            return itertools.islice(order, start, stop)
+        included = bytearray(len(order))
+        for row_id in row_ids:
+            included[row_id] = 1
+        return itertools.islice(itertools.compress(order, map(included.__getitem__, order)), start, stop)
+
+
+def add_indexes(table, *names):
+    for name in names:
+        table.indexes[name] = HashIndex(table.columns[name])
+
+
+def add_sorted_indexes(table, *names):
+    for name in names:
+        table.indexes[name] = SortedIndex(table.columns[name])
+
+
+def add_trigram_index(table, *names):
+    # indexes the values of columns joined together, keyed by the tuple of column names
+    table.indexes[names] = TrigramIndex(*(table.columns[name] for name in names))
+
+
+def add_orderings(table, *names):
+    # adds the permutations for ordering by each column both ascending and descending
+    row_ids = table.row_ids()
+    for name in names:
+        keys = list(map(table.column(name).sort_key(), range(len(table))))
+        order = sorted(row_ids, key=keys.__getitem__)
+        table.orderings[name] = Permutation(table, name, False, array.array('i', order))
+        # descending order keeps rows with equal keys in natural order too, like sorting with `reverse=True`
+        groups = [list(group) for _, group in itertools.groupby(order, key=keys.__getitem__)]
+        table.orderings['-%s' % name] = Permutation(
+            table, name, True, array.array('i', itertools.chain.from_iterable(reversed(groups))),
+        )
@@ -0,0 +1,199 @@
+import datetime
+import threading
+
+from noms_ops.cube import cubes
+from noms_ops.graph import graphs
+from noms_ops.models import credit_statuses, disbursement_statuses, methods, prisons, sources, \
+    prisoner_keys, sender_keys, recipient_keys
+from noms_ops.tables import prisoner_list, sender_list, recipient_list, credits_list, disbursement_list, \
+    current_prisoner_list
+
+
+class Ingester:
+    # adds credits and disbursements to loaded tables while the prototype is running;
+    # prisoner, sender and recipient rollups, distinct counterparty counts, indexes and orderings are
+    # all updated in place so tables never need rebuilding, as are aggregate cubes and counterparty graphs
+    def __init__(self, prisoners, senders, recipients, credits, disbursements, current_prisoners, cubes=(),
+                 graphs=()):
+        self.prisoners = prisoners
+        self.senders = senders
+        self.recipients = recipients
+        self.credits = credits
+        self.disbursements = disbursements
+        self.current_prisoners = current_prisoners
+        self.cubes = cubes
+        self.graphs = graphs
+        # senders and recipients have no natural key so they are found by all their details
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def check_amount(self, amount):
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+            raise ValueError('Amount must be a positive whole number of pence')
+
+    def check_prison(self, prison):
+        if prison and prison not in prisons:
+            raise ValueError('Unknown prison')
+
+    def check_details(self, record, keys, category, choices):
+        # details are checked before anything is added so that an ingest either fully applies or changes nothing
+        if any(not isinstance(record.get(key, ''), str) for key in keys):
+            raise ValueError('Details must be text')
+        if record.get(category) not in choices:
+            raise ValueError('Unknown %s' % category)
+
+    def existing_prisoner(self, prisoner):
+        if any(not isinstance(prisoner.get(key), str) or not prisoner.get(key) for key in prisoner_keys):
+            raise ValueError('Prisoner name and number are required')
+        self.check_prison(prisoner.get('prison'))
+        row_ids = self.prisoners.indexes['prisoner_number'].lookup(prisoner['prisoner_number'])
+        if row_ids:
+            return row_ids[0]
+        return None
+
+    def find_prisoner(self, prisoner):
+        row_id = self.existing_prisoner(prisoner)
+        if row_id is not None:
+            return row_id
+        if prisoner.get('prison'):
+            self.current_prisoners.add(prisoner['prisoner_number'])
+        return self.prisoners.append({
+            'prison': prisoner.get('prison'),
+            **{key: prisoner[key] for key in prisoner_keys},
+        })
+
+    def find_row(self, table, keys, record):
+        rows = self.rows.get(table)
+        if rows is None:
+            columns = [table.columns[key] for key in keys]
+            rows = self.rows[table] = {
+                tuple(column[row_id] for column in columns): row_id
+                for row_id in range(len(table))
+            }
+        details = tuple(record.get(key, '') for key in keys)
+        row_id = rows.get(details)
+        if row_id is None:
+            row_id = rows[details] = table.append(dict(zip(keys, details)))
+        return row_id
+
+    def find_sender(self, sender):
+        return self.find_row(self.senders, sender_keys, sender)
+
+    def find_recipient(self, recipient):
+        return self.find_row(self.recipients, recipient_keys, recipient)
+
+    def has_pair(self, table, key, row_id, other_key, other_row_id):
+        # whether a credit or disbursement already links the two rows, checking the shorter posting list
+        postings = table.indexes[key].lookup(row_id)
+        other_postings = table.indexes[other_key].lookup(other_row_id)
+        if len(other_postings) < len(postings):
+            key, row_id, other_key, other_row_id, postings = other_key, other_row_id, key, row_id, other_postings
+        values = table.columns[other_key].values
+        return any(values[posting] == other_row_id for posting in postings)
+
+    def prison_for(self, prisoner, prison):
+        # the prisoner's own prison and the prison of the credit or disbursement, checked before the prisoner is added
+        self.check_prison(prison)
+        prisoner_id = self.existing_prisoner(prisoner)
+        if prisoner_id is None:
+            prisoner_prison = prisoner.get('prison') or None
+        else:
+            prisoner_prison = self.prisoners.columns['prison'][prisoner_id]
+        if not (prisoner_prison or prison):
+            raise ValueError('Prison is required for prisoners not in prison')
+        return prisoner_prison, prisoner_prison or prison
+
+    def update_cubes(self, facts, row_id):
+        for cube in self.cubes:
+            if cube.facts is facts:
+                cube.add(row_id)
+
+    def update_graphs(self, facts, row_id):
+        # called when a row links a pair of rows for the first time
+        for graph in self.graphs:
+            if graph.facts is facts:
+                graph.add(facts.columns[graph.key][row_id], facts.columns[graph.other_key][row_id])
+
+    def add_credit(self, prisoner, sender, amount, received_at=None, status='pending', prison=None):
+        # `prisoner` and `sender` are mappings of prisoner and sender details,
+        # new prisoners and senders are added if they are not found; returns the new credit's row id
+        if status not in credit_statuses:
+            raise ValueError('Unknown credit status')
+        self.check_amount(amount)
+        self.check_details(sender, sender_keys, 'source', sources)
+        with self.lock:
+            prisoner_prison, prison = self.prison_for(prisoner, prison)
+            prisoner_id = self.find_prisoner(prisoner)
+            sender_id = self.find_sender(sender)
+            new_pair = not self.has_pair(self.credits, 'prisoner_id', prisoner_id, 'sender_id', sender_id)
+            row_id = self.credits.append({
+                'received_at': received_at or datetime.datetime.now().replace(microsecond=0),
+                'status': status,
+                'amount': amount,
+                'prison': prison,
+                'prisoner_id': prisoner_id,
+                'sender_id': sender_id,
+            })
+
+            prisoner_columns, sender_columns = self.prisoners.columns, self.senders.columns
+            prisoner_columns['credit_count'].values[prisoner_id] += 1
+            prisoner_columns['credit_total'].values[prisoner_id] += amount
+            sender_columns['credit_count'].values[sender_id] += 1
+            sender_columns['credit_total'].values[sender_id] += amount
+            if new_pair:
+                prisoner_columns['sender_count'].values[prisoner_id] += 1
+                sender_columns['prisoner_count'].values[sender_id] += 1
+                self.update_graphs(self.credits, row_id)
+            if prisoner_prison:
+                sender_prisons = sender_columns['prisons']
+                sender_prisons.add(sender_id, prisoner_prison)
+                sender_columns['prison_count'].values[sender_id] = len(sender_prisons[sender_id])
+            self.prisoners.changed(prisoner_id, 'credit_count', 'credit_total', 'sender_count')
+            self.senders.changed(sender_id, 'credit_count', 'credit_total', 'prisoner_count', 'prison_count')
+            self.update_cubes(self.credits, row_id)
+            return row_id
+
+    def add_disbursement(self, prisoner, recipient, amount, created=None, resolution='entered', prison=None):
+        # `prisoner` and `recipient` are mappings of prisoner and recipient details,
+        # new prisoners and recipients are added if they are not found; returns the new disbursement's row id
+        if resolution not in disbursement_statuses:
+            raise ValueError('Unknown disbursement status')
+        self.check_amount(amount)
+        self.check_details(recipient, recipient_keys, 'method', methods)
+        with self.lock:
+            prisoner_prison, prison = self.prison_for(prisoner, prison)
+            prisoner_id = self.find_prisoner(prisoner)
+            recipient_id = self.find_recipient(recipient)
+            new_pair = not self.has_pair(self.disbursements, 'prisoner_id', prisoner_id, 'recipient_id', recipient_id)
+            row_id = self.disbursements.append({
+                'created': created or datetime.datetime.now().replace(microsecond=0),
+                'resolution': resolution,
+                'amount': amount,
+                'invoice_number': 'PMD%s' % (len(self.disbursements) + 1000000),
+                'prison': prison,
+                'prisoner_id': prisoner_id,
+                'recipient_id': recipient_id,
+            })
+
+            prisoner_columns, recipient_columns = self.prisoners.columns, self.recipients.columns
+            prisoner_columns['disbursement_count'].values[prisoner_id] += 1
+            prisoner_columns['disbursement_total'].values[prisoner_id] += amount
+            recipient_columns['disbursement_count'].values[recipient_id] += 1
+            recipient_columns['disbursement_total'].values[recipient_id] += amount
+            if new_pair:
+                prisoner_columns['recipient_count'].values[prisoner_id] += 1
+                recipient_columns['prisoner_count'].values[recipient_id] += 1
+                self.update_graphs(self.disbursements, row_id)
+            if prisoner_prison:
+                recipient_prisons = recipient_columns['prisons']
+                recipient_prisons.add(recipient_id, prisoner_prison)
+                recipient_columns['prison_count'].values[recipient_id] = len(recipient_prisons[recipient_id])
+            self.prisoners.changed(prisoner_id, 'disbursement_count', 'disbursement_total', 'recipient_count')
+            self.recipients.changed(recipient_id, 'disbursement_count', 'disbursement_total', 'prisoner_count',
+                                    'prison_count')
+            self.update_cubes(self.disbursements, row_id)
+            return row_id
+
+
+ingester = Ingester(prisoner_list, sender_list, recipient_list, credits_list, disbursement_list, current_prisoner_list,
+                    cubes, graphs)
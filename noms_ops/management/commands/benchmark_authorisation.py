@@ -0,0 +1,52 @@
+import base64
+import logging
+import time
+
+from django.core.handlers.base import BaseHandler
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from mtp_prototypes.auth import BasicAuthorisationMiddleware
+
+
+class Command(BaseCommand):
+    help = 'Measures requests per second through the basic authorisation middleware and the whole middleware stack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        authorisation = 'Basic %s' % base64.b64encode(b'mtp:pass:word').decode()
+        requests = [
+            ('static asset', factory.get('/static/javascripts/noms_ops.js')),
+            ('authorised page', factory.get('/', HTTP_AUTHORIZATION=authorisation)),
+            ('unauthorised page', factory.get('/', HTTP_AUTHORIZATION='Basic bXRwOndyb25n')),
+        ]
+        with override_settings(BASIC_AUTH_USERNAME='mtp', BASIC_AUTH_PASSWORD='pass:word'):
+            middleware = BasicAuthorisationMiddleware(lambda request: None)
+            handler = BaseHandler()
+            handler.load_middleware()
+
+            self.stdout.write('Authorisation middleware alone')
+            for title, request in requests:
+                self.timed(title, lambda: middleware(request), options['requests'])
+            # static assets are only routed through the stack in the production profile
+            self.stdout.write('Whole middleware stack and view')
+            # refused requests would otherwise each be logged as a warning
+            request_logger = logging.getLogger('django.request')
+            level = request_logger.level
+            request_logger.setLevel(logging.ERROR)
+            try:
+                for title, request in requests[1:]:
+                    self.timed(title, lambda: handler.get_response(request), options['requests'] // 20)
+            finally:
+                request_logger.setLevel(level)
+
+    def timed(self, title, respond, count):
+        start_time = time.perf_counter()
+        for _ in range(count):
+            respond()
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write('  %s: %0.0f requests/s' % (title, count / elapsed))
@@ -0,0 +1,67 @@
+import array
+import datetime
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from noms_ops.cube import DAY, cubes
+from noms_ops.store import DateTimeColumn
+
+
+def walk_window_totals(cube, gte, lte):
+    # counts and totals of every entity within the window found by walking credits or disbursements instead
+    size = len(cube.table)
+    counts, totals = array.array('q', bytes(8 * size)), array.array('q', bytes(8 * size))
+    columns = cube.facts.columns
+    dates, entities, amounts = columns[cube.date_name].values, columns[cube.key].values, columns['amount'].values
+    lower = DateTimeColumn.encode(datetime.datetime.combine(gte, datetime.time.min))
+    upper = DateTimeColumn.encode(datetime.datetime.combine(lte, datetime.time.min)) + DAY
+    window = cube.facts.indexes[cube.date_name].window(lower, upper)
+    order = cube.facts.indexes[cube.date_name].order
+    for position in window:
+        row_id = position if order is None else order[position]
+        if lower <= dates[row_id] < upper:
+            entity = entities[row_id]
+            counts[entity] += 1
+            totals[entity] += amounts[row_id]
+    return counts, totals
+
+
+class Command(BaseCommand):
+    help = 'Compares finding prisoner and sender totals within date windows using aggregate cubes and ' \
+           'by walking credits and disbursements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for cube in cubes:
+            start_time = time.perf_counter()
+            cube.build()
+            self.stdout.write('%s by %s: %d cells of %d rows, built in %0.2fs' % (
+                cube.total_name, cube.key, len(cube), len(cube.facts),
+                time.perf_counter() - start_time,
+            ))
+            dates = cube.facts.columns[cube.date_name]
+            if not len(dates):
+                continue
+            first, last = min(dates.values), max(dates.values)
+            first, last = DateTimeColumn.decode(first).date(), DateTimeColumn.decode(last).date()
+            for days in (1, 7, (last - first).days + 1):
+                gte = last - datetime.timedelta(days=days - 1)
+
+                def timed(window_totals):
+                    elapsed = []
+                    for _ in range(options['repeat']):
+                        start_time = time.perf_counter()
+                        totals = window_totals(cube, gte, last)
+                        elapsed.append(time.perf_counter() - start_time)
+                    return min(elapsed), totals
+
+                walk_time, walk_totals = timed(walk_window_totals)
+                cube_time, cube_totals = timed(lambda cube, gte, lte: cube.window_totals(gte, lte))
+                if cube_totals != walk_totals:
+                    raise CommandError('Totals from %r differ from walking rows' % cube)
+                self.stdout.write('  %d days: walking rows %0.1fms, summing cells %0.1fms (%0.1fx faster)' % (
+                    days, walk_time * 1000, cube_time * 1000, walk_time / cube_time,
+                ))
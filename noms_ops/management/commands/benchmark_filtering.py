@@ -0,0 +1,159 @@
+import datetime
+import time
+
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+
+from noms_ops.forms import CreditForm, parse_amount
+from noms_ops.models import generate_dataset, build_tables
+
+
+class StopFiltering(Exception):
+    pass
+
+
+class LegacyFilters:
+    # the per-row filters that FilterForm.object_list used before filter plans were compiled
+
+    def perform_filter__amount(self, query_data, obj):
+        amount_pattern = query_data.get('amount_pattern')
+        if amount_pattern == 'not_integral':
+            if not bool(obj['amount'] % 100):
+                raise StopFiltering
+        elif amount_pattern == 'not_multiple_5':
+            if str(obj['amount'])[-3:] in ('000', '500'):
+                raise StopFiltering
+        elif amount_pattern == 'not_multiple_10':
+            if str(obj['amount'])[-3:] == '000':
+                raise StopFiltering
+        elif amount_pattern == 'gte_100':
+            if obj['amount'] < 10000:
+                raise StopFiltering
+        elif amount_pattern == 'exact':
+            if obj['amount'] != parse_amount(query_data['amount_exact']):
+                raise StopFiltering
+        elif amount_pattern == 'pence':
+            if obj['amount'] % 100 != int(query_data['amount_pence']):
+                raise StopFiltering
+        return {'amount_pattern', 'amount_exact', 'amount_pence'}
+
+    def perform_filter__prisoner_name(self, query_data, obj):
+        prisoner_name = query_data.get('prisoner_name')
+        if prisoner_name and (prisoner_name.upper() not in obj['prisoner_name'].upper()):
+            raise StopFiltering
+        return {'prisoner_name'}
+
+    def perform_filter__sender_name(self, query_data, obj):
+        sender_name = query_data.get('sender_name')
+        if sender_name and (sender_name.upper() not in obj['sender_name'].upper()):
+            raise StopFiltering
+        return {'sender_name'}
+
+    def perform_filter__received_at(self, query_data, obj):
+        received_at__gte = query_data.get('received_at__gte')
+        received_at__lt = query_data.get('received_at__lt')
+        if received_at__gte:
+            if obj['received_at'].date() < received_at__gte:
+                raise StopFiltering
+        if received_at__lt:
+            if obj['received_at'].date() > received_at__lt:
+                raise StopFiltering
+        return {'received_at__gte', 'received_at__lt'}
+
+    def object_list(self, form):
+        query_data = form.get_query_data()
+        ordering = query_data.pop('ordering', '') or form['ordering'].initial
+        if ordering.startswith('-'):
+            reverse = True
+            ordering = ordering[1:]
+        else:
+            reverse = False
+
+        object_filters = []
+        for method in filter(lambda attr: attr.startswith('perform_filter__'), dir(self)):
+            method = getattr(self, method)
+            if callable(method):
+                object_filters.append(method)
+
+        def compare(obj):
+            filtered_fields = {'ordering'}
+            for object_filter in object_filters:
+                try:
+                    filtered_fields.update(object_filter(query_data, obj))
+                except StopFiltering:
+                    return False
+
+            for field in form.fields:
+                if field in filtered_fields:
+                    continue
+                value = query_data.get(field)
+                if not value:
+                    continue
+                if obj[field] != value:
+                    return False
+
+            return True
+
+        return sorted(filter(compare, form.object_source), key=lambda obj: obj[ordering], reverse=reverse)
+
+
+class Command(BaseCommand):
+    help = 'Compares filter engines and compiled filter plans with per-row filtering on a generated dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credits', type=int, default=1000000)
+        parser.add_argument('--seed', default='benchmark')
+        parser.add_argument('--skip-legacy', action='store_true', help='Only time compiled filter plans')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Generating %d credits…' % options['credits'])
+        tables = build_tables(generate_dataset(
+            seed=options['seed'], credit_count=options['credits'],
+            prisoner_count=max(80, options['credits'] // 50), sender_count=max(90, options['credits'] // 20),
+        ))
+        form_class = type('BenchmarkCreditForm', (CreditForm,), {'object_source': tables[3]})
+
+        recently = datetime.date.today() - datetime.timedelta(days=3)
+        queries = [
+            {},
+            {'amount_pattern': 'not_multiple_5'},
+            {'amount_pattern': 'exact', 'amount_exact': '£20.00', 'ordering': 'amount'},
+            {'prison': 'LEI', 'status': 'pending'},
+            {'prisoner_name': 'john', 'amount_pattern': 'gte_100'},
+            {'sender_name': 'smith', 'received_at__gte': recently.isoformat()},
+            {'prisoner_number': tables[0][0]['prisoner_number']},
+        ]
+        legacy = LegacyFilters()
+        for query in queries:
+            self.stdout.write('%r' % query)
+            results = {}
+            for engine in ('python', 'numpy'):
+                with override_settings(NOMS_OPS_FILTER_ENGINE=engine):
+                    form = form_class(data=dict(query))
+                    if not form.is_valid():
+                        self.stderr.write('  invalid query')
+                        break
+                    start_time = time.perf_counter()
+                    row_ids = list(form.get_filter_plan().row_ids())
+                    results[engine] = time.perf_counter() - start_time, row_ids
+                    self.stdout.write('  %d matches, %s engine %0.3fs' % (
+                        len(row_ids), form.get_filter_plan().engine, results[engine][0],
+                    ))
+            if not results:
+                continue
+            if results['numpy'][1] != results['python'][1]:
+                self.stderr.write('  engine results differ!')
+            if options['skip_legacy']:
+                continue
+
+            start_time = time.perf_counter()
+            object_list = form.object_list
+            compiled_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            legacy_object_list = legacy.object_list(form)
+            legacy_time = time.perf_counter() - start_time
+            self.stdout.write('  sorted objects: compiled plan %0.3fs, per-row filters %0.3fs (%0.1fx)' % (
+                compiled_time, legacy_time, legacy_time / compiled_time,
+            ))
+            if [obj['id'] for obj in legacy_object_list] != [obj['id'] for obj in object_list]:
+                self.stderr.write('  results differ!')
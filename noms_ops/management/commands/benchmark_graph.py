@@ -0,0 +1,67 @@
+import array
+import random
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from noms_ops.graph import graphs
+
+
+def posting_neighbours(facts, key, other_key, nodes):
+    # neighbours found by looking up the credits or disbursements of each node in a hash index instead
+    index, other_values = facts.indexes[key], facts.columns[other_key].values
+    found = set()
+    for node in nodes:
+        found.update(other_values[row_id] for row_id in index.lookup(node))
+    return array.array('i', sorted(found))
+
+
+def posting_two_hop(facts, key, other_key, nodes):
+    found = posting_neighbours(facts, other_key, key, posting_neighbours(facts, key, other_key, nodes))
+    nodes = set(nodes)
+    return array.array('i', (node for node in found if node not in nodes))
+
+
+class Command(BaseCommand):
+    help = 'Compares finding neighbours and nodes two hops away using counterparty graphs and ' \
+           'by looking up credits and disbursements in hash indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        for graph in graphs:
+            start_time = time.perf_counter()
+            graph.build()
+            self.stdout.write('%s to %s: %d edges between %d and %d rows, built in %0.2fs' % (
+                graph.key, graph.other_key, len(graph), len(graph.table), len(graph.other_table),
+                time.perf_counter() - start_time,
+            ))
+            facts, key, other_key = graph.facts, graph.key, graph.other_key
+            nodes = [rng.randrange(len(graph.table)) for _ in range(options['sample'])]
+            other_nodes = [rng.randrange(len(graph.other_table)) for _ in range(options['sample'])]
+            queries = [
+                ('neighbours', graph.neighbours, lambda nodes: posting_neighbours(facts, key, other_key, nodes), nodes),
+                ('reverse neighbours', graph.reverse_neighbours,
+                 lambda nodes: posting_neighbours(facts, other_key, key, nodes), other_nodes),
+                ('two hops', graph.two_hop, lambda nodes: posting_two_hop(facts, key, other_key, nodes), nodes),
+                ('reverse two hops', graph.reverse_two_hop,
+                 lambda nodes: posting_two_hop(facts, other_key, key, nodes), other_nodes),
+            ]
+            for title, graph_query, posting_query, sample in queries:
+                def timed(query):
+                    start_time = time.perf_counter()
+                    results = [query([node]) for node in sample]
+                    return time.perf_counter() - start_time, results
+
+                posting_time, posting_results = timed(posting_query)
+                graph_time, graph_results = timed(graph_query)
+                if graph_results != posting_results:
+                    raise CommandError('%s from %r differ from index lookups' % (title.capitalize(), graph))
+                found = sum(map(len, graph_results)) / len(sample)
+                self.stdout.write('  %s (%0.1f found): index lookups %0.3fms, graph %0.3fms (%0.1fx faster)' % (
+                    title, found, posting_time * 1000 / len(sample), graph_time * 1000 / len(sample),
+                    posting_time / graph_time,
+                ))
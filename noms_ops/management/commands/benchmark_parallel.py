@@ -0,0 +1,47 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from noms_ops.forms import CreditForm, DisbursementForm
+
+# filters that indexes cannot narrow enough, so every row within their date window is scanned
+full_scans = [
+    (CreditForm, {'sender_name': 'a', 'prisoner_name': 'e', 'amount_pattern': 'not_integral'}),
+    (CreditForm, {'postcode': '1', 'prisoner_name': 'a', 'amount_pattern': 'not_multiple_5'}),
+    (DisbursementForm, {'recipient_name': 'a', 'city': 'o', 'amount_pattern': 'not_multiple_10'}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compares scanning tables to filter them in 1 to N processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for form_class, data in full_scans:
+            form = form_class(data=data)
+            if not form.is_valid():
+                raise CommandError('Invalid filter %r: %s' % (data, form.errors))
+            self.stdout.write('%s %s:' % (form_class.__name__, ', '.join('%s=%s' % item for item in data.items())))
+            serial_time = serial_row_ids = None
+            for workers in range(1, options['workers'] + 1):
+                with override_settings(NOMS_OPS_PARALLEL_THRESHOLD=0, NOMS_OPS_PARALLEL_WORKERS=workers):
+                    # the first scan forks the processes
+                    list(form.get_filter_plan().row_ids())
+                    elapsed = []
+                    for _ in range(options['repeat']):
+                        start_time = time.perf_counter()
+                        row_ids = list(form.get_filter_plan().row_ids())
+                        elapsed.append(time.perf_counter() - start_time)
+                if serial_row_ids is None:
+                    serial_time, serial_row_ids = min(elapsed), row_ids
+                elif row_ids != serial_row_ids:
+                    raise CommandError('Rows found by %d processes differ from 1 process' % workers)
+                self.stdout.write('  %d process%s: %d rows in %0.1fms (%0.1fx)' % (
+                    workers, '' if workers == 1 else 'es', len(row_ids), min(elapsed) * 1000,
+                    serial_time / min(elapsed),
+                ))
@@ -0,0 +1,97 @@
+import gc
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve
+
+from noms_ops.memory import memory_usage
+from noms_ops.tables import prisoner_list, sender_list, recipient_list, credits_list, disbursement_list
+
+# requests served by each worker, reading most columns of every table
+requests = [
+    '/noms_ops/credits/?export=jsonl',
+    '/noms_ops/disbursements/?export=jsonl',
+    '/noms_ops/credits/senders/?export=csv',
+    '/noms_ops/credits/prisoners/?export=csv',
+    '/noms_ops/credits/?sender_name=smith&page_size=1000',
+    '/noms_ops/credits/?prisoner_name=john&ordering=prisoner_name&page_size=1000',
+    '/noms_ops/credits/senders/?sender_email=example.com&ordering=-credit_total&page_size=1000',
+    '/noms_ops/disbursements/?sender_name=smith&page_size=1000',
+]
+
+
+def serve_requests():
+    factory = RequestFactory()
+    for url in requests:
+        request = factory.get(url)
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elif hasattr(response, 'render'):
+            response.render()
+
+
+class Command(BaseCommand):
+    help = 'Measures the memory used by forked workers serving requests before and after freezing the loaded tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        if settings.NOMS_OPS_FREEZE_TABLES:
+            self.stderr.write('Tables were frozen when loaded, set NOMS_OPS_FREEZE_TABLES=false to compare')
+        else:
+            self.measure('Tables not frozen', options['workers'])
+        for table in (prisoner_list, sender_list, recipient_list, credits_list, disbursement_list):
+            table.freeze()
+        gc.collect()
+        gc.freeze()
+        self.measure('Tables and objects frozen', options['workers'])
+
+    def measure(self, title, worker_count):
+        workers = []
+        for _ in range(worker_count):
+            # workers say when they are done and then wait to be measured before exiting
+            done_read, done_write = os.pipe()
+            exit_read, exit_write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    serve_requests()
+                    status = 0
+                finally:
+                    os.write(done_write, b'.')
+                    os.read(exit_read, 1)
+                    os._exit(status)
+            os.close(done_write)
+            os.close(exit_read)
+            workers.append((pid, done_read, exit_write))
+
+        usages = []
+        for pid, done_read, _ in workers:
+            os.read(done_read, 1)
+            usages.append(memory_usage(pid))
+        failures = 0
+        for pid, done_read, exit_write in workers:
+            os.write(exit_write, b'.')
+            _, status = os.waitpid(pid, 0)
+            failures += status != 0
+            os.close(done_read)
+            os.close(exit_write)
+
+        self.stdout.write(title)
+        self.stdout.write('  master: USS %0.1f MiB' % (memory_usage()['uss'] / 1048576))
+        for pid, usage in zip((pid for pid, _, _ in workers), usages):
+            self.stdout.write('  worker %d: USS %0.1f MiB, PSS %0.1f MiB, RSS %0.1f MiB' % (
+                pid, usage['uss'] / 1048576, usage['pss'] / 1048576, usage['rss'] / 1048576,
+            ))
+        self.stdout.write('  mean worker USS %0.1f MiB' % (
+            sum(usage['uss'] for usage in usages) / len(usages) / 1048576
+        ))
+        if failures:
+            self.stderr.write('  %d workers failed to serve requests' % failures)
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from noms_ops.rendering import row_html_cache
+from noms_ops.views import CreditView, SenderView, PrisonerView, DisbursementView
+
+
+class Command(BaseCommand):
+    help = 'Compares rendering result tables with compiled row renderers and with template loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        query = {'page_size': options['page_size']}
+        views = [
+            (CreditView.title, CreditView.as_view()),
+            (SenderView.title, SenderView.as_view()),
+            ('%s (credits)' % PrisonerView.title, PrisonerView.as_view(axis='credits')),
+            ('%s (disbursements)' % PrisonerView.title, PrisonerView.as_view(axis='disbursements')),
+            (DisbursementView.title, DisbursementView.as_view()),
+        ]
+        for title, view in views:
+            self.stdout.write(title)
+
+            def timed(renderer, prepare=None):
+                elapsed = []
+                with override_settings(NOMS_OPS_ROW_RENDERER=renderer):
+                    for _ in range(options['repeat']):
+                        if prepare:
+                            prepare()
+                        start_time = time.perf_counter()
+                        response = view(factory.get('/', query))
+                        response.render()
+                        elapsed.append(time.perf_counter() - start_time)
+                return min(elapsed), response
+
+            template_time, response = timed('template')
+            rows = len(response.context_data['object_list'])
+            cold_time, _ = timed('compiled', prepare=row_html_cache.clear)
+            warm_time, _ = timed('compiled')
+
+            def rate(elapsed):
+                return rows / elapsed
+
+            self.stdout.write('  %d rows' % rows)
+            self.stdout.write('  template loop %0.1fms (%0.0f rows/s)' % (template_time * 1000, rate(template_time)))
+            self.stdout.write('  compiled rows %0.1fms without cached fragments (%0.0f rows/s), '
+                              '%0.1fms with (%0.0f rows/s, %0.1fx faster than template loop)' % (
+                                  cold_time * 1000, rate(cold_time), warm_time * 1000, rate(warm_time),
+                                  template_time / warm_time,
+                              ))
+        cache_info = row_html_cache.cache_info()
+        self.stdout.write('Fragment cache: %0.0f%% hit rate, %d rows using %d bytes' % (
+            cache_info.hit_rate * 100, cache_info.entries, cache_info.currsize,
+        ))
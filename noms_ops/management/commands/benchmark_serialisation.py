@@ -0,0 +1,59 @@
+import time
+
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+
+from noms_ops.export import row_json_cache
+from noms_ops.templatetags.noms_ops import dump_object
+from noms_ops.views import CreditView, SenderView, PrisonerView, DisbursementView
+
+
+class Command(BaseCommand):
+    help = 'Compares the JSON endpoint of each filter view with rendering its template which dumps each row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        query = {'page_size': options['page_size']}
+        for view_class in (CreditView, SenderView, PrisonerView, DisbursementView):
+            view = view_class.as_view()
+            self.stdout.write(view_class.title)
+
+            def timed(data, prepare=None):
+                elapsed = []
+                for _ in range(options['repeat']):
+                    if prepare:
+                        prepare()
+                    start_time = time.perf_counter()
+                    response = view(factory.get('/', data))
+                    if hasattr(response, 'render'):
+                        response.render()
+                    elapsed.append(time.perf_counter() - start_time)
+                return min(elapsed), response
+
+            template_time, response = timed(query)
+            rows = response.context_data['object_list']
+            dump_times = []
+            row_json_cache.clear()
+            for _ in range(2):
+                start_time = time.perf_counter()
+                for row in rows:
+                    dump_object(row)
+                dump_times.append(time.perf_counter() - start_time)
+            cold_time, _ = timed(dict(query, format='json'), prepare=row_json_cache.clear)
+            warm_time, response = timed(dict(query, format='json'))
+
+            self.stdout.write('  %d rows, %d bytes of JSON' % (len(rows), len(response.content)))
+            self.stdout.write('  template %0.1fms, of which dump_object %0.1fms without cached rows, %0.1fms with' % (
+                template_time * 1000, dump_times[0] * 1000, dump_times[1] * 1000,
+            ))
+            self.stdout.write('  JSON %0.1fms without cached rows, %0.1fms with (%0.1fx faster than template)' % (
+                cold_time * 1000, warm_time * 1000, template_time / warm_time,
+            ))
+        cache_info = row_json_cache.cache_info()
+        self.stdout.write('Row cache: %0.0f%% hit rate, %d rows using %d bytes' % (
+            cache_info.hit_rate * 100, cache_info.entries, cache_info.currsize,
+        ))
@@ -0,0 +1,53 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from noms_ops.datafile import write_dataset_file
+from noms_ops.models import generate_dataset, parse_base_date, load_snapshot, build_tables
+
+
+class Command(BaseCommand):
+    help = 'Builds tables and indexes from a generated dataset or a snapshot and writes them to a dataset file ' \
+           'that is mapped instead of building tables on start-up'
+    # system checks import URLs, views and forms, which would load a dataset besides the one written
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=settings.NOMS_OPS_DATASET_FILE,
+                            help='Dataset file path; defaults to NOMS_OPS_DATASET_FILE')
+        parser.add_argument('--snapshot', help='Build tables from this snapshot instead of generating a dataset')
+        parser.add_argument('--seed',
+                            help='Random seed; the same seed, batch size and base date reproduce the same dataset')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--base-date', type=parse_base_date,
+                            help='Date as YYYY-MM-DD that generated dates are relative to; defaults to today')
+        for name in ('prisoner', 'sender', 'recipient', 'credit', 'disbursement'):
+            parser.add_argument('--%ss' % name, dest='%s_count' % name, type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Provide a dataset file path or set NOMS_OPS_DATASET_FILE')
+
+        start_time = time.time()
+        if options['snapshot']:
+            dataset = load_snapshot(options['snapshot'])
+        else:
+            dataset = generate_dataset(
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+                base_date=options['base_date'],
+                prisoner_count=options['prisoner_count'],
+                sender_count=options['sender_count'],
+                recipient_count=options['recipient_count'],
+                credit_count=options['credit_count'],
+                disbursement_count=options['disbursement_count'],
+            )
+        tables = build_tables(dataset)
+        write_dataset_file(path, *tables)
+        self.stdout.write('Wrote %d credits and %d disbursements with seed %s to %s (%d MiB) in %0.1fs' % (
+            len(tables[3]), len(tables[4]), dataset['seed'], path, os.path.getsize(path) // 1048576,
+            time.time() - start_time,
+        ))
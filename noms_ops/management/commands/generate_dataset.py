@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from noms_ops.models import generate_dataset, parse_base_date, save_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic dataset and saves it as a snapshot that is loaded instead of generating new data'
+    # system checks import URLs, views and forms, which would load a dataset besides the one written
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=settings.NOMS_OPS_SNAPSHOT,
+                            help='Snapshot file path; defaults to NOMS_OPS_SNAPSHOT')
+        parser.add_argument('--seed',
+                            help='Random seed; the same seed, batch size and base date reproduce the same dataset')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--base-date', type=parse_base_date,
+                            help='Date as YYYY-MM-DD that generated dates are relative to; defaults to today')
+        for name in ('prisoner', 'sender', 'recipient', 'credit', 'disbursement'):
+            parser.add_argument('--%ss' % name, dest='%s_count' % name, type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Provide a snapshot path or set NOMS_OPS_SNAPSHOT')
+
+        start_time = time.time()
+        dataset = generate_dataset(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            base_date=options['base_date'],
+            prisoner_count=options['prisoner_count'],
+            sender_count=options['sender_count'],
+            recipient_count=options['recipient_count'],
+            credit_count=options['credit_count'],
+            disbursement_count=options['disbursement_count'],
+        )
+        save_snapshot(dataset, path)
+        self.stdout.write('Saved %d credits and %d disbursements with seed %s to %s in %0.1fs' % (
+            len(dataset['credits']), len(dataset['disbursements']), dataset['seed'], path, time.time() - start_time,
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management import BaseCommand
+
+from noms_ops.scan import features, scans
+
+
+def describe_row(row):
+    if 'prisoner_number' in row:
+        return '%s %s' % (row['prisoner_number'], row['prisoner_name'])
+    return '%s (%s)' % (row['sender_name'], row['id'])
+
+
+class Command(BaseCommand):
+    help = 'Ranks payment sources or prisoners by amount patterns and velocity of all their credits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=sorted(scans), default='sender')
+        parser.add_argument('--top', type=int, default=20)
+
+    def handle(self, *args, **options):
+        scan = scans[options['by']]
+        start_time = time.perf_counter()
+        report = scan.report(options['top'])
+        self.stdout.write('Scanned credits of %d %ss in %0.2fs' % (
+            len(scan.table), options['by'], time.perf_counter() - start_time,
+        ))
+        for position, label in enumerate(features.values(), start=1):
+            self.stdout.write('  %d. %s' % (position, label))
+        headings = ' '.join('%5d.' % position for position in range(1, len(features) + 1))
+        self.stdout.write('%4s  %-40s %7s  %s' % ('', options['by'].capitalize(), 'Score', headings))
+        for rank, (row, score, values) in enumerate(report, start=1):
+            self.stdout.write('%4d  %-40s %7.1f  %s' % (
+                rank, describe_row(row)[:40], score, ' '.join('%6d' % value for value in values.values()),
+            ))
@@ -0,0 +1,31 @@
+import os
+
+# fields of /proc/<pid>/smaps_rollup summed into each measure of memory use
+memory_fields = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Private_Clean': 'uss',
+    'Private_Dirty': 'uss',
+}
+
+
+def memory_usage(pid='self'):
+    # resident, proportional and unique set sizes of a process in bytes; only available on Linux
+    usage = {'rss': 0, 'pss': 0, 'uss': 0}
+    path = '/proc/%s/smaps_rollup' % pid
+    if not os.path.exists(path):
+        path = '/proc/%s/smaps' % pid
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            measure = memory_fields.get(name)
+            if measure:
+                usage[measure] += int(value.split()[0]) * 1024
+    return usage
+
+
+def describe_memory_usage(pid='self'):
+    return 'USS %(uss)d MiB, PSS %(pss)d MiB, RSS %(rss)d MiB' % {
+        measure: size // 1048576
+        for measure, size in memory_usage(pid).items()
+    }
@@ -1,20 +1,32 @@
+import collections
 import datetime
 import enum
-import itertools
+import logging
+import operator
+import os
+import pickle
 import random
+import time
 
-from django.utils.crypto import get_random_string
+from django.conf import settings
 import faker
 
-fake = faker.Faker(locale='en_GB')
+from noms_ops.datafile import map_dataset_file, write_dataset_file
+from noms_ops.indexes import add_indexes, add_orderings, add_sorted_indexes, add_trigram_index
+from noms_ops.query import result_cache
+from noms_ops.startup import timed
+from noms_ops.store import Table, CategoryColumn, CategorySetColumn, DateTimeColumn, ForeignKeyColumn, \
+    IntegerColumn, StringColumn
 
-PRISONER_COUNT = 80
-SENDER_COUNT = 90
-RECIPIENT_COUNT = 40
-CREDIT_COUNT = 100
-DISBURSEMENT_COUNT = 60
+logger = logging.getLogger('mtp')
 
-yesterday = datetime.date.today() - datetime.timedelta(days=1)
+PRISONER_COUNT = settings.NOMS_OPS_PRISONER_COUNT
+SENDER_COUNT = settings.NOMS_OPS_SENDER_COUNT
+RECIPIENT_COUNT = settings.NOMS_OPS_RECIPIENT_COUNT
+CREDIT_COUNT = settings.NOMS_OPS_CREDIT_COUNT
+DISBURSEMENT_COUNT = settings.NOMS_OPS_DISBURSEMENT_COUNT
+BATCH_SIZE = settings.NOMS_OPS_BATCH_SIZE
+SNAPSHOT_VERSION = 1
 
 prisons = {
     'BXI': 'HMP Brixton',
@@ -52,223 +64,408 @@ class AmountPattern(enum.Enum):
         return [(choice.name, choice.value) for choice in cls]
 
 
-def generate_prisoner_list():
-    prison_choices = itertools.cycle(prisons.keys())
-    for i in range(PRISONER_COUNT):
-        yield {
-            'id': i,
-            'prison': next(prison_choices) if random.random() < 0.95 else None,
-            'prisoner_name': ('%s %s' % (fake.first_name_male(), fake.last_name())).upper(),
-            'prisoner_number': 'X%s%s' % (
-                get_random_string(4, '0123456789'),
-                get_random_string(2, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
-            ),
-
-            '_senders': set(), '_recipients': set(),
-            'sender_count': 0, 'recipient_count': 0,
-            'credit_count': 0, 'credit_total': 0,
-            'disbursement_count': 0, 'disbursement_total': 0,
-        }
-
-
-prisoner_list = sorted(generate_prisoner_list(), key=lambda prisoner: prisoner['prisoner_number'])
-current_prisoner_list = set(prisoner['prisoner_number'] for prisoner in prisoner_list if prisoner['prison'])
-skipped_prisoner_keys = {
-    'sender_count', 'recipient_count',
-    'credit_count', 'credit_total', 'disbursement_count', 'disbursement_total',
-}
-
-
-def generate_sender_list():
-    for i in range(SENDER_COUNT):
-        bank_transfer = bool(random.random() < 0.1)
-        yield {
-            'id': i,
-            'source': 'bank_transfer' if bank_transfer else 'online',
-            'sender_name': fake.name(),
-            'sender_sort_code': get_random_string(6, '0123456789') if bank_transfer else '',
-            'sender_account_number': get_random_string(8, '0123456789') if bank_transfer else '',
-            'card_number_last_digits': '' if bank_transfer else get_random_string(4, '0123456789'),
-            'sender_email': '' if bank_transfer else fake.email(),
-            'postcode': '' if bank_transfer else fake.postcode(),
-            'ip_address': '' if bank_transfer else fake.ipv4(),
-
-            '_prisoners': set(), '_prisons': set(),
-            'prisoner_count': 0, 'prison_count': 0,
-            'credit_count': 0, 'credit_total': 0,
-        }
-
-
-sender_list = sorted(generate_sender_list(), key=lambda sender: sender['sender_name'])
-skipped_sender_keys = {
-    'prisoner_count', 'prison_count',
-    'credit_count', 'credit_total',
-}
-
-
-def generate_credits_list():
-    for i in range(CREDIT_COUNT):
-        amount = random.random()
-        if amount > 0.8:
-            amount = 2000
-        elif amount > 0.7:
-            amount = 2500
-        elif amount > 0.4:
-            amount = random.choice([3000, 3500, 1500])
-        elif amount > 0.2:
-            amount = random.randrange(1, 10) * 1000 + random.randrange(1, 10) * 100
-        else:
-            amount = int(amount * 10000)
-        received_at = fake.date_time_between(start_date='-15days', end_date='-1days')
-        credit = {
-            'id': i,
-            'received_at': received_at,
-            'status': random.choice(list(credit_statuses.keys())) if received_at.date() == yesterday else 'credited',
-            'amount': amount,
-        }
-
-        prisoner = random.choice(prisoner_list)
-        prisoner['credit_count'] += 1
-        prisoner['credit_total'] += amount
-        for key, value in prisoner.items():
-            if key.startswith('_'):
-                continue
-            if key in skipped_prisoner_keys:
-                continue
-            credit[key] = value
-
-        sender = random.choice(sender_list)
-        sender['credit_count'] += 1
-        sender['credit_total'] += amount
-        for key, value in sender.items():
-            if key.startswith('_'):
-                continue
-            if key in skipped_sender_keys:
-                continue
-            credit[key] = value
-
-        prisoner['_senders'].add(sender['id'])
-        sender['_prisoners'].add(prisoner['id'])
-
-        if prisoner['prison']:
-            sender['_prisons'].add(prisoner['prison'])
-        else:
-            credit['prison'] = random.choice(list(prisons.keys()))
-
-        yield credit
-
-
-credits_list = sorted(generate_credits_list(), key=lambda credit: credit['received_at'], reverse=True)
-
-
-def generate_recipients_list():
-    for i in range(RECIPIENT_COUNT):
-        bank_transfer = bool(random.random() > 0.27)
-        address_line1, *address_line2 = fake.street_address().split('\n')
-        address_line2 = ''.join(address_line2)
-        yield {
-            'id': i,
-            'method': 'bank_transfer' if bank_transfer else 'cheque',
-            'recipient_first_name': fake.first_name(),
-            'recipient_last_name': fake.last_name(),
-            'recipient_email': fake.email() if random.random() > 0.1 else '',
-            'address_line1': address_line1,
-            'address_line2': address_line2,
-            'city': fake.city(),
-            'postcode': fake.postcode(),
-            'country': 'UK',
-            'sort_code': get_random_string(6, '0123456789') if bank_transfer else '',
-            'account_number': get_random_string(8, '0123456789') if bank_transfer else '',
-
-            '_prisoners': set(), '_prisons': set(),
-            'prisoner_count': 0, 'prison_count': 0,
-            'disbursement_count': 0, 'disbursement_total': 0,
-        }
-
-
-recipient_list = sorted(generate_recipients_list(), key=lambda recipient: recipient['recipient_last_name'])
-skipped_recipient_keys = {
-    'prisoner_count', 'prison_count',
-    'disbursement_count', 'disbursement_total',
-}
-
-
-def generate_disbursements_list():
-    for i in range(DISBURSEMENT_COUNT):
-        amount = random.random()
-        if amount > 0.8:
-            amount = 2000
-        elif amount > 0.7:
-            amount = 5000
-        elif amount > 0.4:
-            amount = random.choice([10000, 4000, 1500])
-        elif amount > 0.2:
-            amount = random.randrange(1, 10) * 1000 + random.randrange(1, 10) * 100
-        else:
-            amount = int(amount * 10000)
-        created = fake.date_time_between(start_date='-15days')
-        disbursement = {
-            'id': i,
-            'created': created,
-            'resolution': (
-                random.choice(list(disbursement_statuses.keys())) if created.date() >= yesterday else 'sent'
-            ),
-            'amount': amount,
-            'invoice_number': 'PMD%s' % (i + 1000000),
-        }
-
-        prisoner = random.choice(prisoner_list)
-        prisoner['disbursement_count'] += 1
-        prisoner['disbursement_total'] += amount
-        for key, value in prisoner.items():
-            if key.startswith('_'):
-                continue
-            if key in skipped_prisoner_keys:
-                continue
-            disbursement[key] = value
-
-        recipient = random.choice(recipient_list)
-        recipient['disbursement_count'] += 1
-        recipient['disbursement_total'] += amount
-        for key, value in recipient.items():
-            if key.startswith('_'):
-                continue
-            if key in skipped_recipient_keys:
-                continue
-            disbursement[key] = value
-
-        prisoner['_recipients'].add(recipient['id'])
-        recipient['_prisoners'].add(prisoner['id'])
-
-        if prisoner['prison']:
-            recipient['_prisons'].add(prisoner['prison'])
-        else:
-            disbursement['prison'] = random.choice(list(prisons.keys()))
-
-        yield disbursement
-
-
-disbursement_list = sorted(generate_disbursements_list(), key=lambda disbursement: disbursement['created'],
-                           reverse=True)
-
-
-def post_process():
-    global prisoner_list, sender_list, recipient_list
-    for prisoner in prisoner_list:
-        prisoner['sender_count'] = len(prisoner.pop('_senders'))
-        prisoner['recipient_count'] = len(prisoner.pop('_recipients'))
-    for sender in sender_list:
-        sender['prisoner_count'] = len(sender.pop('_prisoners'))
-        sender['prison_count'] = len(sender['_prisons'])
-        sender['prisons'] = list(sender.pop('_prisons'))
-    for recipient in recipient_list:
-        recipient['prisoner_count'] = len(recipient.pop('_prisoners'))
-        recipient['prison_count'] = len(recipient['_prisons'])
-        recipient['prisons'] = list(recipient.pop('_prisons'))
-    prisoner_list = list(filter(lambda obj: obj['sender_count'] or obj['recipient_count'], prisoner_list))
-    sender_list = list(filter(lambda obj: obj['prisoner_count'], sender_list))
-    recipient_list = list(filter(lambda obj: obj['prisoner_count'], recipient_list))
-
-
-post_process()
-del fake
+# credits and disbursements are generated as compact records that refer to prisoners, senders and recipients by id;
+# they are only loaded into the tables used by forms once the whole dataset is available
+CreditRecord = collections.namedtuple('CreditRecord', 'received_at status amount prisoner sender prison')
+DisbursementRecord = collections.namedtuple('DisbursementRecord', 'created resolution amount prisoner recipient prison')
+
+
+def random_string(rng, length, allowed_chars='0123456789'):
+    return ''.join(rng.choice(allowed_chars) for _ in range(length))
+
+
+def random_datetime(rng, start, end):
+    return start + datetime.timedelta(seconds=rng.randint(0, int((end - start).total_seconds())))
+
+
+def random_amount(rng, common_amounts):
+    amount = rng.random()
+    if amount > 0.8:
+        return common_amounts[0]
+    elif amount > 0.7:
+        return common_amounts[1]
+    elif amount > 0.4:
+        return rng.choice(common_amounts[2:])
+    elif amount > 0.2:
+        return rng.randrange(1, 10) * 1000 + rng.randrange(1, 10) * 100
+    return int(amount * 10000)
+
+
+def seeded_batches(seed, name, count, batch_size):
+    # every batch has its own random state so any batch can be reproduced from the seed alone
+    fake = faker.Faker(locale='en_GB')
+    for batch, start in enumerate(range(0, count, batch_size)):
+        rng = random.Random('%s:%s:%d' % (seed, name, batch))
+        fake.seed_instance(rng.random())
+        yield rng, fake, range(start, min(start + batch_size, count))
+
+
+def generate_prisoner_records(seed, count, batch_size):
+    prison_choices = list(prisons.keys())
+    for rng, fake, ids in seeded_batches(seed, 'prisoners', count, batch_size):
+        for i in ids:
+            yield {
+                'id': i,
+                'prison': prison_choices[i % len(prison_choices)] if rng.random() < 0.95 else None,
+                'prisoner_name': ('%s %s' % (fake.first_name_male(), fake.last_name())).upper(),
+                'prisoner_number': 'X%s%s' % (
+                    random_string(rng, 4),
+                    random_string(rng, 2, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+                ),
+            }
+
+
+def generate_sender_records(seed, count, batch_size):
+    for rng, fake, ids in seeded_batches(seed, 'senders', count, batch_size):
+        for i in ids:
+            bank_transfer = bool(rng.random() < 0.1)
+            yield {
+                'id': i,
+                'source': 'bank_transfer' if bank_transfer else 'online',
+                'sender_name': fake.name(),
+                'sender_sort_code': random_string(rng, 6) if bank_transfer else '',
+                'sender_account_number': random_string(rng, 8) if bank_transfer else '',
+                'card_number_last_digits': '' if bank_transfer else random_string(rng, 4),
+                'sender_email': '' if bank_transfer else fake.email(),
+                'postcode': '' if bank_transfer else fake.postcode(),
+                'ip_address': '' if bank_transfer else fake.ipv4(),
+            }
+
+
+def generate_recipient_records(seed, count, batch_size):
+    for rng, fake, ids in seeded_batches(seed, 'recipients', count, batch_size):
+        for i in ids:
+            bank_transfer = bool(rng.random() > 0.27)
+            address_line1, *address_line2 = fake.street_address().split('\n')
+            address_line2 = ''.join(address_line2)
+            yield {
+                'id': i,
+                'method': 'bank_transfer' if bank_transfer else 'cheque',
+                'recipient_first_name': fake.first_name(),
+                'recipient_last_name': fake.last_name(),
+                'recipient_email': fake.email() if rng.random() > 0.1 else '',
+                'address_line1': address_line1,
+                'address_line2': address_line2,
+                'city': fake.city(),
+                'postcode': fake.postcode(),
+                'country': 'UK',
+                'sort_code': random_string(rng, 6) if bank_transfer else '',
+                'account_number': random_string(rng, 8) if bank_transfer else '',
+            }
+
+
+def generate_credit_records(seed, count, batch_size, prisoners, sender_count, now):
+    start, end = now - datetime.timedelta(days=15), now - datetime.timedelta(days=1)
+    yesterday = now.date() - datetime.timedelta(days=1)
+    prison_choices = list(prisons.keys())
+    for rng, _, ids in seeded_batches(seed, 'credits', count, batch_size):
+        for _ in ids:
+            amount = random_amount(rng, [2000, 2500, 3000, 3500, 1500])
+            received_at = random_datetime(rng, start, end)
+            status = rng.choice(list(credit_statuses.keys()))
+            prisoner = rng.randrange(len(prisoners))
+            yield CreditRecord(
+                received_at=received_at,
+                status=status if received_at.date() == yesterday else 'credited',
+                amount=amount,
+                prisoner=prisoner,
+                sender=rng.randrange(sender_count),
+                prison=None if prisoners[prisoner]['prison'] else rng.choice(prison_choices),
+            )
+
+
+def generate_disbursement_records(seed, count, batch_size, prisoners, recipient_count, now):
+    start = now - datetime.timedelta(days=15)
+    yesterday = now.date() - datetime.timedelta(days=1)
+    prison_choices = list(prisons.keys())
+    for rng, _, ids in seeded_batches(seed, 'disbursements', count, batch_size):
+        for _ in ids:
+            amount = random_amount(rng, [2000, 5000, 10000, 4000, 1500])
+            created = random_datetime(rng, start, now)
+            resolution = rng.choice(list(disbursement_statuses.keys()))
+            prisoner = rng.randrange(len(prisoners))
+            yield DisbursementRecord(
+                created=created,
+                resolution=resolution if created.date() >= yesterday else 'sent',
+                amount=amount,
+                prisoner=prisoner,
+                recipient=rng.randrange(recipient_count),
+                prison=None if prisoners[prisoner]['prison'] else rng.choice(prison_choices),
+            )
+
+
+def parse_base_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Base date %r is not in the format YYYY-MM-DD' % value)
+
+
+def generate_dataset(seed=None, prisoner_count=None, sender_count=None, recipient_count=None,
+                     credit_count=None, disbursement_count=None, batch_size=None, base_date=None):
+    if seed is None:
+        seed = settings.NOMS_OPS_SEED or str(random.randrange(2 ** 32))
+    batch_size = batch_size or BATCH_SIZE
+    sender_count = sender_count or SENDER_COUNT
+    recipient_count = recipient_count or RECIPIENT_COUNT
+    if base_date is None:
+        base_date = parse_base_date(settings.NOMS_OPS_BASE_DATE) if settings.NOMS_OPS_BASE_DATE else \
+            datetime.date.today()
+    # dates are generated relative to midday of the base date rather than the current time,
+    # so the same seed, batch size and base date always produce the same dataset
+    now = datetime.datetime.combine(base_date, datetime.time(12))
+    start_time = time.time()
+
+    prisoners = list(generate_prisoner_records(seed, prisoner_count or PRISONER_COUNT, batch_size))
+    dataset = {
+        'version': SNAPSHOT_VERSION,
+        'seed': seed,
+        'batch_size': batch_size,
+        'generated_at': now,
+        'base_date': base_date,
+        'prisoners': prisoners,
+        'senders': list(generate_sender_records(seed, sender_count, batch_size)),
+        'recipients': list(generate_recipient_records(seed, recipient_count, batch_size)),
+        'credits': list(generate_credit_records(
+            seed, credit_count or CREDIT_COUNT, batch_size, prisoners, sender_count, now,
+        )),
+        'disbursements': list(generate_disbursement_records(
+            seed, disbursement_count or DISBURSEMENT_COUNT, batch_size, prisoners, recipient_count, now,
+        )),
+    }
+    logger.info('Generated dataset with seed %s in %0.1fs', seed, time.time() - start_time)
+    return dataset
+
+
+def save_snapshot(dataset, path):
+    with open(path, 'wb') as f:
+        pickle.dump(dataset, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        dataset = pickle.load(f)
+    if dataset.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('Dataset snapshot %s has an unsupported version' % path)
+    return dataset
+
+
+def load_dataset():
+    path = settings.NOMS_OPS_SNAPSHOT
+    if path and os.path.exists(path):
+        start_time = time.time()
+        dataset = load_snapshot(path)
+        logger.info('Loaded dataset snapshot %s in %0.1fs', path, time.time() - start_time)
+        return dataset
+    dataset = generate_dataset()
+    if path:
+        save_snapshot(dataset, path)
+    return dataset
+
+
+prisoner_keys = ('prisoner_name', 'prisoner_number')
+sender_keys = (
+    'source', 'sender_name', 'sender_sort_code', 'sender_account_number', 'card_number_last_digits',
+    'sender_email', 'postcode', 'ip_address',
+)
+recipient_keys = (
+    'method', 'recipient_first_name', 'recipient_last_name', 'recipient_email',
+    'address_line1', 'address_line2', 'city', 'postcode', 'country', 'sort_code', 'account_number',
+)
+
+
+def record_columns(records, keys, column_class=StringColumn):
+    return [(key, column_class(record[key] for record in records)) for key in keys]
+
+
+def counter_columns(keys, count):
+    return [(key, IntegerColumn([0] * count)) for key in keys]
+
+
+def build_prisoner_table(records):
+    return Table(collections.OrderedDict([
+        ('prison', CategoryColumn((record['prison'] for record in records), categories=prisons)),
+        *record_columns(records, prisoner_keys),
+        *counter_columns((
+            'sender_count', 'recipient_count',
+            'credit_count', 'credit_total', 'disbursement_count', 'disbursement_total',
+        ), len(records)),
+    ]))
+
+
+def build_sender_table(records):
+    return Table(collections.OrderedDict([
+        ('source', CategoryColumn((record['source'] for record in records), categories=sources)),
+        *record_columns(records, sender_keys[1:]),
+        *counter_columns(('prisoner_count', 'prison_count', 'credit_count', 'credit_total'), len(records)),
+        ('prisons', CategorySetColumn(prisons, [()] * len(records))),
+    ]))
+
+
+def build_recipient_table(records):
+    return Table(collections.OrderedDict([
+        ('method', CategoryColumn((record['method'] for record in records), categories=methods)),
+        *record_columns(records, recipient_keys[1:]),
+        *counter_columns(('prisoner_count', 'prison_count', 'disbursement_count', 'disbursement_total'), len(records)),
+        ('prisons', CategorySetColumn(prisons, [()] * len(records))),
+    ]))
+
+
+def build_credit_table(records, prisoner_records, prisoner_rows, sender_rows, prisoners, senders):
+    return Table(collections.OrderedDict([
+        ('received_at', DateTimeColumn(record.received_at for record in records)),
+        ('status', CategoryColumn((record.status for record in records), categories=credit_statuses)),
+        ('amount', IntegerColumn(record.amount for record in records)),
+        ('prison', CategoryColumn(
+            (prisoner_records[record.prisoner]['prison'] or record.prison for record in records),
+            categories=prisons,
+        )),
+        ('prisoner_id', ForeignKeyColumn(prisoner_rows[record.prisoner] for record in records)),
+        ('sender_id', ForeignKeyColumn(sender_rows[record.sender] for record in records)),
+    ]), references=[
+        ('prisoner_id', prisoners, prisoner_keys),
+        ('sender_id', senders, sender_keys),
+    ], reverse_order=True)
+
+
+def build_disbursement_table(records, prisoner_records, prisoner_rows, recipient_rows, prisoners, recipients):
+    return Table(collections.OrderedDict([
+        ('created', DateTimeColumn(record.created for _, record in records)),
+        ('resolution', CategoryColumn((record.resolution for _, record in records), categories=disbursement_statuses)),
+        ('amount', IntegerColumn(record.amount for _, record in records)),
+        ('invoice_number', StringColumn('PMD%s' % (record_id + 1000000) for record_id, _ in records)),
+        ('prison', CategoryColumn(
+            (prisoner_records[record.prisoner]['prison'] or record.prison for _, record in records),
+            categories=prisons,
+        )),
+        ('prisoner_id', ForeignKeyColumn(prisoner_rows[record.prisoner] for _, record in records)),
+        ('recipient_id', ForeignKeyColumn(recipient_rows[record.recipient] for _, record in records)),
+    ]), references=[
+        ('prisoner_id', prisoners, prisoner_keys),
+        ('recipient_id', recipients, recipient_keys),
+    ], reverse_order=True)
+
+
+def aggregate_credits(credits, prisoners, senders):
+    columns = credits.columns
+    prisoner_columns, sender_columns = prisoners.columns, senders.columns
+    prisoner_prisons = prisoner_columns['prison']
+    sender_prisons = sender_columns['prisons']
+    pairs = set()
+    for prisoner_id, sender_id, amount in zip(columns['prisoner_id'].values, columns['sender_id'].values,
+                                              columns['amount'].values):
+        prisoner_columns['credit_count'].values[prisoner_id] += 1
+        prisoner_columns['credit_total'].values[prisoner_id] += amount
+        sender_columns['credit_count'].values[sender_id] += 1
+        sender_columns['credit_total'].values[sender_id] += amount
+        if (prisoner_id, sender_id) not in pairs:
+            pairs.add((prisoner_id, sender_id))
+            prisoner_columns['sender_count'].values[prisoner_id] += 1
+            sender_columns['prisoner_count'].values[sender_id] += 1
+        prison = prisoner_prisons[prisoner_id]
+        if prison:
+            sender_prisons.add(sender_id, prison)
+    for sender_id in range(len(senders)):
+        sender_columns['prison_count'].values[sender_id] = len(sender_prisons[sender_id])
+
+
+def aggregate_disbursements(disbursements, prisoners, recipients):
+    columns = disbursements.columns
+    prisoner_columns, recipient_columns = prisoners.columns, recipients.columns
+    prisoner_prisons = prisoner_columns['prison']
+    recipient_prisons = recipient_columns['prisons']
+    pairs = set()
+    for prisoner_id, recipient_id, amount in zip(columns['prisoner_id'].values, columns['recipient_id'].values,
+                                                 columns['amount'].values):
+        prisoner_columns['disbursement_count'].values[prisoner_id] += 1
+        prisoner_columns['disbursement_total'].values[prisoner_id] += amount
+        recipient_columns['disbursement_count'].values[recipient_id] += 1
+        recipient_columns['disbursement_total'].values[recipient_id] += amount
+        if (prisoner_id, recipient_id) not in pairs:
+            pairs.add((prisoner_id, recipient_id))
+            prisoner_columns['recipient_count'].values[prisoner_id] += 1
+            recipient_columns['prisoner_count'].values[recipient_id] += 1
+        prison = prisoner_prisons[prisoner_id]
+        if prison:
+            recipient_prisons.add(recipient_id, prison)
+    for recipient_id in range(len(recipients)):
+        recipient_columns['prison_count'].values[recipient_id] = len(recipient_prisons[recipient_id])
+
+
+def build_tables(dataset):
+    with timed('build tables'):
+        # stored oldest first, reversing beforehand keeps records with the same date in generation order when presented
+        credit_records = sorted(reversed(dataset['credits']), key=operator.attrgetter('received_at'))
+        disbursement_records = sorted(reversed(list(enumerate(dataset['disbursements']))),
+                                      key=lambda record: record[1].created)
+
+        # only prisoners, senders and recipients with credits or disbursements are kept
+        prisoner_records = dataset['prisoners']
+        prisoner_rows = {record.prisoner for record in credit_records}
+        prisoner_rows.update(record.prisoner for _, record in disbursement_records)
+        prisoner_rows = sorted(prisoner_rows, key=lambda prisoner: prisoner_records[prisoner]['prisoner_number'])
+        prisoners = build_prisoner_table([prisoner_records[prisoner] for prisoner in prisoner_rows])
+        prisoner_rows = {prisoner: row_id for row_id, prisoner in enumerate(prisoner_rows)}
+
+        sender_records = dataset['senders']
+        sender_rows = sorted({record.sender for record in credit_records},
+                             key=lambda sender: sender_records[sender]['sender_name'])
+        senders = build_sender_table([sender_records[sender] for sender in sender_rows])
+        sender_rows = {sender: row_id for row_id, sender in enumerate(sender_rows)}
+
+        recipient_records = dataset['recipients']
+        recipient_rows = sorted({record.recipient for _, record in disbursement_records},
+                                key=lambda recipient: recipient_records[recipient]['recipient_last_name'])
+        recipients = build_recipient_table([recipient_records[recipient] for recipient in recipient_rows])
+        recipient_rows = {recipient: row_id for row_id, recipient in enumerate(recipient_rows)}
+
+        credits = build_credit_table(credit_records, prisoner_records, prisoner_rows, sender_rows, prisoners, senders)
+        aggregate_credits(credits, prisoners, senders)
+        disbursements = build_disbursement_table(disbursement_records, prisoner_records, prisoner_rows, recipient_rows,
+                                                 prisoners, recipients)
+        aggregate_disbursements(disbursements, prisoners, recipients)
+
+    with timed('build indexes'):
+        add_indexes(prisoners, 'prisoner_number', 'prison')
+        add_indexes(senders, 'sender_sort_code', 'sender_account_number', 'card_number_last_digits', 'ip_address')
+        add_indexes(credits, 'prisoner_id', 'sender_id', 'prison', 'status')
+        add_indexes(disbursements, 'prisoner_id', 'recipient_id', 'prison', 'resolution', 'invoice_number')
+        add_sorted_indexes(credits, 'received_at')
+        add_sorted_indexes(disbursements, 'created')
+        add_trigram_index(prisoners, 'prisoner_name')
+        add_trigram_index(senders, 'sender_name')
+        add_trigram_index(senders, 'sender_email')
+        add_trigram_index(senders, 'postcode')
+        add_trigram_index(recipients, 'recipient_first_name', 'recipient_last_name')
+        add_trigram_index(recipients, 'recipient_email')
+        add_trigram_index(recipients, 'postcode')
+
+    # permutations for the ordering choices of each form
+    with timed('build orderings'):
+        add_orderings(credits, 'received_at', 'amount', 'source', 'prison', 'prisoner_name', 'prisoner_number',
+                      'status')
+        add_orderings(senders, 'prisoner_count', 'prison_count', 'credit_count', 'credit_total')
+        add_orderings(prisoners, 'sender_count', 'credit_count', 'credit_total', 'disbursement_count',
+                      'disbursement_total', 'prisoner_name', 'prisoner_number')
+        add_orderings(disbursements, 'created', 'amount', 'prisoner_name', 'prisoner_number')
+
+    current_prisoners = set(record['prisoner_number'] for record in prisoner_records if record['prison'])
+    # results of filtering previous tables are no longer valid
+    result_cache.clear()
+    return prisoners, senders, recipients, credits, disbursements, current_prisoners
+
+
+def load_tables():
+    # tables are mapped from a dataset file if one exists as they are then used without building them
+    path = settings.NOMS_OPS_DATASET_FILE
+    if path and os.path.exists(path):
+        with timed('map dataset file'):
+            tables = map_dataset_file(path)
+        logger.info('Mapped dataset file %s', path)
+        return tables
+    with timed('load dataset'):
+        dataset = load_dataset()
+    tables = build_tables(dataset)
+    if path:
+        write_dataset_file(path, *tables)
+    return tables
@@ -0,0 +1,653 @@
+import array
+import atexit
+import datetime
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from noms_ops.cache import LRUCache
+from noms_ops.indexes import SortedIndex
+from noms_ops.store import CategoryColumn, CategorySetColumn, DateTimeColumn, IntegerColumn, LookupColumn
+
+# matching row ids of recently used filter plans, keyed on the table's id, its version and canonical query
+result_cache = LRUCache(settings.NOMS_OPS_RESULT_CACHE_SIZE, sizeof=lambda row_ids: len(row_ids) + 1)
+
+
+def as_numpy(column, window=None):
+    # a view sharing memory with the column's array which must not outlive the evaluation of a query
+    values = numpy.asarray(column.values)
+    if window is not None:
+        values = values[window]
+    return values
+
+
+class Predicate:
+    # rough fraction of rows expected to match, used to run the most selective predicates first
+    selectivity = 0.5
+    names = ()
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, ', '.join(self.names))
+
+    def estimate(self, table):
+        return self.selectivity
+
+    def matches(self, *values):
+        raise NotImplementedError
+
+    def is_lookup(self, columns):
+        return all(isinstance(column, LookupColumn) and column.keys is columns[0].keys for column in columns)
+
+    def matching_references(self, columns):
+        # test each referenced row once rather than every row that refers to it
+        referenced_columns = [column.column for column in columns]
+        return set(
+            referenced_id
+            for referenced_id in range(len(referenced_columns[0]))
+            if self.matches(*(column[referenced_id] for column in referenced_columns))
+        )
+
+    def compile(self, table):
+        try:
+            columns = [table.column(name) for name in self.names]
+        except KeyError:
+            return lambda row_id: False
+        if self.is_lookup(columns):
+            matching = self.matching_references(columns)
+            keys = columns[0].keys.values
+            return lambda row_id: keys[row_id] in matching
+        return self.compile_columns(columns)
+
+    def compile_columns(self, columns):
+        matches = self.matches
+        if len(columns) == 1:
+            column = columns[0]
+            return lambda row_id: matches(column[row_id])
+        return lambda row_id: matches(*(column[row_id] for column in columns))
+
+    def mask(self, table, window=slice(None)):
+        # returns a boolean array of matching rows within the window or None if this predicate cannot be vectorised
+        try:
+            columns = [table.column(name) for name in self.names]
+        except KeyError:
+            return numpy.zeros(len(range(len(table))[window]), dtype=bool)
+        if self.is_lookup(columns):
+            matching = self.matching_references(columns)
+            selected = numpy.zeros(len(columns[0].column), dtype=bool)
+            selected[numpy.fromiter(matching, dtype=numpy.int64, count=len(matching))] = True
+            return selected[as_numpy(columns[0].keys, window)]
+        return self.mask_columns(columns, window)
+
+    def mask_columns(self, columns, window):
+        return None
+
+    def lookup(self, table):
+        # returns arrays of matching row ids found using indexes or None if no index applies
+        return None
+
+    def window(self, table):
+        # returns the range of rows that this predicate matches entirely or None if rows need testing individually
+        return None
+
+
+class Equals(Predicate):
+    selectivity = 0.01
+
+    def __init__(self, name, value):
+        self.names = (name,)
+        self.value = value
+
+    def estimate(self, table):
+        column = table.columns.get(self.names[0])
+        if isinstance(column, CategoryColumn):
+            return 1 / len(column.categories)
+        return self.selectivity
+
+    def matches(self, value):
+        return value == self.value
+
+    def compile_columns(self, columns):
+        column = columns[0]
+        if isinstance(column, CategoryColumn):
+            code, values = column.codes.get(self.value), column.values
+            return lambda row_id: values[row_id] == code
+        return super().compile_columns(columns)
+
+    def mask_columns(self, columns, window):
+        column = columns[0]
+        if isinstance(column, CategoryColumn):
+            code = column.codes.get(self.value)
+            if code is None:
+                return numpy.zeros(len(column.values[window]), dtype=bool)
+            return as_numpy(column, window) == code
+        if isinstance(column, IntegerColumn):
+            return as_numpy(column, window) == self.value
+        return None
+
+    def lookup(self, table):
+        name = self.names[0]
+        try:
+            column = table.column(name)
+        except KeyError:
+            return []
+        if isinstance(column, LookupColumn):
+            index, key_index = column.table.indexes.get(column.name), table.indexes.get(column.key)
+            if index is None or key_index is None:
+                return None
+            return [key_index.lookup(referenced_id) for referenced_id in index.lookup(self.value)]
+        index = table.indexes.get(name)
+        if index is None:
+            return None
+        return [index.lookup(self.value)]
+
+
+class InSet(Predicate):
+    def __init__(self, name, values):
+        self.names = (name,)
+        self.values = values
+
+    def matches(self, value):
+        return value in self.values
+
+
+class InRows(Predicate):
+    # rows whose ids were found beforehand, e.g. by following the edges of a counterparty graph
+    def __init__(self, row_ids):
+        self.names = ('id',)
+        self.row_ids = row_ids
+
+    def estimate(self, table):
+        return len(self.row_ids) / len(table) if len(table) else 0
+
+    def compile_columns(self, columns):
+        row_ids = set(self.row_ids)
+        return row_ids.__contains__
+
+    def mask_columns(self, columns, window):
+        selected = numpy.zeros(len(columns[0]), dtype=bool)
+        selected[numpy.asarray(self.row_ids, dtype=numpy.int64)] = True
+        return selected[window]
+
+    def lookup(self, table):
+        return [self.row_ids]
+
+
+class Contains(Predicate):
+    # case-insensitive substring match on one or more columns joined together
+    selectivity = 0.05
+
+    def __init__(self, names, text):
+        self.names = tuple(names)
+        self.text = text.upper()
+
+    def matches(self, *values):
+        return self.text in ''.join(values).upper()
+
+    def referenced_index(self, columns):
+        return columns[0].table.indexes.get(tuple(column.name for column in columns))
+
+    def matching_references(self, columns):
+        index = self.referenced_index(columns)
+        if index is None:
+            return super().matching_references(columns)
+        return set(index.search(self.text))
+
+    def compile(self, table):
+        index = table.indexes.get(self.names)
+        if index is None:
+            return super().compile(table)
+        text, values = self.text, index.values
+        return lambda row_id: text in values[row_id]
+
+    def lookup(self, table):
+        try:
+            columns = [table.column(name) for name in self.names]
+        except KeyError:
+            return []
+        if self.is_lookup(columns):
+            index, key_index = self.referenced_index(columns), table.indexes.get(columns[0].key)
+            if index is None or key_index is None:
+                return None
+            return [key_index.lookup(referenced_id) for referenced_id in index.search(self.text)]
+        index = table.indexes.get(self.names)
+        if index is None:
+            return None
+        return [index.search(self.text)]
+
+
+class HasCategory(Predicate):
+    def __init__(self, name, category):
+        self.names = (name,)
+        self.category = category
+
+    def matches(self, value):
+        return self.category in value
+
+    def compile_columns(self, columns):
+        column = columns[0]
+        if isinstance(column, CategorySetColumn):
+            if self.category not in column.codes:
+                return lambda row_id: False
+            bit, values = 1 << column.codes[self.category], column.values
+            return lambda row_id: values[row_id] & bit
+        return super().compile_columns(columns)
+
+    def mask_columns(self, columns, window):
+        column = columns[0]
+        if isinstance(column, CategorySetColumn):
+            if self.category not in column.codes:
+                return numpy.zeros(len(column.values[window]), dtype=bool)
+            return (as_numpy(column, window) & numpy.uint64(1 << column.codes[self.category])) != 0
+        return None
+
+
+class DateRange(Predicate):
+    # matches dates between `gte` and `lte` inclusive, either of which may be omitted
+    selectivity = 0.3
+
+    def __init__(self, name, gte=None, lte=None):
+        self.names = (name,)
+        self.gte = gte
+        self.lte = lte
+
+    def matches(self, value):
+        value = value.date()
+        return (not self.gte or value >= self.gte) and (not self.lte or value <= self.lte)
+
+    def bounds(self):
+        # returns an inclusive lower and exclusive upper bound in microseconds
+        lower = DateTimeColumn.encode(datetime.datetime.combine(self.gte, datetime.time.min)) if self.gte else None
+        upper = DateTimeColumn.encode(
+            datetime.datetime.combine(self.lte + datetime.timedelta(days=1), datetime.time.min)
+        ) if self.lte else None
+        return lower, upper
+
+    def compile_columns(self, columns):
+        column = columns[0]
+        if isinstance(column, DateTimeColumn):
+            values = column.values
+            lower, upper = self.bounds()
+            if lower is None:
+                return lambda row_id: values[row_id] < upper
+            if upper is None:
+                return lambda row_id: values[row_id] >= lower
+            return lambda row_id: lower <= values[row_id] < upper
+        return super().compile_columns(columns)
+
+    def mask_columns(self, columns, window):
+        column = columns[0]
+        if not isinstance(column, DateTimeColumn):
+            return None
+        values = as_numpy(column, window)
+        lower, upper = self.bounds()
+        if lower is None:
+            return values < upper
+        if upper is None:
+            return values >= lower
+        return (values >= lower) & (values < upper)
+
+    def window(self, table):
+        index = table.indexes.get(self.names[0])
+        if not isinstance(index, SortedIndex) or index.order is not None:
+            return None
+        return index.window(*self.bounds())
+
+    def lookup(self, table):
+        index = table.indexes.get(self.names[0])
+        if not isinstance(index, SortedIndex) or index.order is None:
+            return None
+        window = index.window(*self.bounds())
+        return [index.order[window.start:window.stop]]
+
+
+class GreaterThan(Predicate):
+    def __init__(self, name, value):
+        self.names = (name,)
+        self.value = value
+
+    def matches(self, value):
+        return value > self.value
+
+    def compile_columns(self, columns):
+        column = columns[0]
+        if isinstance(column, IntegerColumn):
+            value, values = self.value, column.values
+            return lambda row_id: values[row_id] > value
+        return super().compile_columns(columns)
+
+    def mask_columns(self, columns, window):
+        column = columns[0]
+        if isinstance(column, IntegerColumn):
+            return as_numpy(column, window) > self.value
+        return None
+
+
+class AmountMatches(Predicate):
+    selectivities = {
+        'not_integral': 0.3,
+        'not_multiple_5': 0.4,
+        'not_multiple_10': 0.5,
+        'gte_100': 0.1,
+        'exact': 0.01,
+        'pence': 0.02,
+    }
+
+    def __init__(self, name, pattern, amount=None):
+        self.names = (name,)
+        self.pattern = pattern
+        self.amount = amount
+
+    def estimate(self, table):
+        return self.selectivities.get(self.pattern, self.selectivity)
+
+    def get_test(self):
+        amount = self.amount
+        if self.pattern == 'not_integral':
+            return lambda value: value % 100 != 0
+        if self.pattern == 'not_multiple_5':
+            # amounts under £1 were never considered multiples
+            return lambda value: value % 500 != 0 or value < 100
+        if self.pattern == 'not_multiple_10':
+            return lambda value: value % 1000 != 0 or value < 100
+        if self.pattern == 'gte_100':
+            return lambda value: value >= 10000
+        if self.pattern == 'exact':
+            return lambda value: value == amount
+        if self.pattern == 'pence':
+            return lambda value: value % 100 == amount
+        raise ValueError('Unknown amount pattern %s' % self.pattern)
+
+    def matches(self, value):
+        return self.get_test()(value)
+
+    def compile_columns(self, columns):
+        values, test = columns[0].values, self.get_test()
+        return lambda row_id: test(values[row_id])
+
+    def mask_columns(self, columns, window):
+        values = as_numpy(columns[0], window)
+        if self.pattern == 'not_integral':
+            return values % 100 != 0
+        if self.pattern == 'not_multiple_5':
+            return (values % 500 != 0) | (values < 100)
+        if self.pattern == 'not_multiple_10':
+            return (values % 1000 != 0) | (values < 100)
+        if self.pattern == 'gte_100':
+            return values >= 10000
+        if self.pattern == 'exact':
+            return values == self.amount
+        if self.pattern == 'pence':
+            return values % 100 == self.amount
+        raise ValueError('Unknown amount pattern %s' % self.pattern)
+
+
+class FilterPlan:
+    # predicates are compiled against the table once and run most-selective first for each row;
+    # with the numpy engine, predicates that can be vectorised are evaluated as boolean masks over whole columns
+    # instead; date ranges on sorted columns narrow the rows scanned to a window and
+    # when indexes can find a small enough set of candidate rows, only those candidates are tested;
+    # otherwise windows of at least NOMS_OPS_PARALLEL_THRESHOLD rows of loaded tables are scanned in chunks by
+    # several processes
+    index_threshold = 0.1
+    permutation_threshold = 0.01
+
+    def __init__(self, table, engine=None, cache_key=None):
+        self.table = table
+        self.cache_key = cache_key
+        self.engine = engine or settings.NOMS_OPS_FILTER_ENGINE
+        if self.engine == 'numpy' and numpy is None:
+            self.engine = 'python'
+        self.predicates = []
+        self.matching_row_ids = None
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, ', '.join(map(repr, self.predicates)))
+
+    def add(self, predicate):
+        self.predicates.append(predicate)
+
+    def ordered_predicates(self):
+        return sorted(self.predicates, key=lambda predicate: predicate.estimate(self.table))
+
+    def row_ids(self):
+        window, predicates = self.window(self.ordered_predicates())
+        candidates, predicates = self.indexed_row_ids(window, predicates)
+        if candidates is not None:
+            return self.test_rows(candidates, predicates)
+        if predicates and len(window) >= settings.NOMS_OPS_PARALLEL_THRESHOLD and parallel_workers() > 1 and \
+                is_scan_table(self.table):
+            return parallel_scan(self.table, self.engine, window, predicates)
+        return self.scan(window, predicates)
+
+    def scan(self, window, predicates):
+        if self.engine == 'numpy':
+            return self.numpy_row_ids(window, predicates)
+        return self.test_rows(self.table.row_ids(window), predicates)
+
+    def test_rows(self, row_ids, predicates):
+        for predicate in predicates:
+            row_ids = filter(predicate.compile(self.table), row_ids)
+        return row_ids
+
+    def window(self, predicates):
+        # intersects the ranges of sorted rows that predicates are limited to
+        window, remaining = range(len(self.table)), []
+        for predicate in predicates:
+            predicate_window = predicate.window(self.table)
+            if predicate_window is None:
+                remaining.append(predicate)
+            else:
+                window = range(max(window.start, predicate_window.start), min(window.stop, predicate_window.stop))
+        return window, remaining
+
+    def indexed_row_ids(self, window, predicates):
+        # intersects index lookups smallest first; returns None if indexes are not selective enough to be useful
+        lookups, remaining = [], []
+        for predicate in predicates:
+            postings = predicate.lookup(self.table)
+            if postings is None:
+                remaining.append(predicate)
+            else:
+                lookups.append((sum(map(len, postings)), postings, predicate))
+        if not lookups:
+            return None, predicates
+        lookups.sort(key=lambda lookup: lookup[0])
+        if lookups[0][0] > len(window) * self.index_threshold:
+            return None, predicates
+
+        candidates = set(itertools.chain.from_iterable(lookups[0][1]))
+        for size, postings, predicate in lookups[1:]:
+            if not candidates:
+                break
+            if size > len(candidates) * 16:
+                # testing the few remaining candidates is cheaper than walking a large posting list
+                remaining.append(predicate)
+                continue
+            candidates.intersection_update(itertools.chain.from_iterable(postings))
+        if len(window) < len(self.table):
+            candidates = filter(lambda row_id: window.start <= row_id < window.stop, candidates)
+        return sorted(candidates, reverse=self.table.reverse_order), remaining
+
+    def numpy_row_ids(self, window, predicates):
+        mask, remaining = None, []
+        window_slice = slice(window.start, window.stop)
+        with self.table.lock:
+            for predicate in predicates:
+                predicate_mask = predicate.mask(self.table, window_slice)
+                if predicate_mask is None:
+                    remaining.append(predicate)
+                elif mask is None:
+                    mask = predicate_mask
+                else:
+                    mask &= predicate_mask
+        if mask is None:
+            row_ids = self.table.row_ids(window)
+        else:
+            row_ids = numpy.flatnonzero(mask) + window.start
+            if self.table.reverse_order:
+                row_ids = row_ids[::-1]
+            row_ids = row_ids.tolist()
+        return self.test_rows(row_ids, remaining)
+
+    def count(self):
+        return len(self.matching())
+
+    def matching(self):
+        # row ids in natural order, found once per plan so that counting and paging do not filter again
+        # and kept in the result cache so that re-ordering, paging and returning to a filter are cheap too
+        if self.matching_row_ids is None:
+            if self.cache_key is None:
+                self.matching_row_ids = list(self.row_ids())
+            else:
+                key = (self.table.cache_id, self.table.version, self.cache_key)
+                self.matching_row_ids = result_cache.get(key)
+                if self.matching_row_ids is None:
+                    self.matching_row_ids = array.array('i', self.row_ids())
+                    result_cache.set(key, self.matching_row_ids)
+        return self.matching_row_ids
+
+    def is_presorted(self, ordering):
+        # stable sorting leaves rows in natural order if they are stored sorted by the ordering column
+        index = self.table.indexes.get(ordering.lstrip('-'))
+        return isinstance(index, SortedIndex) and index.order is None and \
+            ordering.startswith('-') == self.table.reverse_order
+
+    def ordered_row_ids(self, ordering, start=0, stop=None):
+        # iterates over matching row ids in order, from `start` until `stop`;
+        # unless few rows match, matches are ordered by walking the precomputed permutation for the ordering,
+        # otherwise only the rows up to `stop` are selected, using a heap rather than sorting all of them
+        row_ids = self.matching()
+        permutation = self.table.orderings.get(ordering)
+        if self.is_presorted(ordering):
+            return itertools.islice(row_ids, start, stop)
+        if permutation is not None and len(row_ids) >= len(self.table) * self.permutation_threshold:
+            return permutation.walk(row_ids, start, stop)
+        reverse = ordering.startswith('-')
+        key = self.table.column(ordering.lstrip('-')).sort_key()
+        if stop is None:
+            row_ids = sorted(row_ids, key=key, reverse=reverse)
+        elif reverse:
+            row_ids = heapq.nlargest(stop, row_ids, key=key)
+        else:
+            row_ids = heapq.nsmallest(stop, row_ids, key=key)
+        return row_ids[start:]
+
+    def page(self, ordering, start=0, stop=None):
+        return list(map(self.table.__getitem__, self.ordered_row_ids(ordering, start, stop)))
+
+    def object_list(self, ordering):
+        return self.page(ordering)
+
+
+# the loaded tables, which are scanned in parallel; tables derived from them, such as those of date windows,
+# are always scanned in one process so that the pool never holds on to them or needs forking again for them
+scan_tables = []
+# processes scanning chunks of tables, forked so that they share the tables' memory copy-on-write rather than
+# being sent them; held as (forking process id, number of processes, table versions when forked, pool)
+scan_pool = None
+# held while the pool is replaced or used so that threads take turns to use every process
+scan_pool_lock = threading.Lock()
+
+
+def register_scan_tables(*tables):
+    scan_tables[:] = tables
+
+
+def is_scan_table(table):
+    return any(table is scan_table for scan_table in scan_tables)
+
+
+def parallel_workers():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return 1
+    return settings.NOMS_OPS_PARALLEL_WORKERS
+
+
+def start_scan_worker():
+    # locks held by other threads of the forking process would never be released in this one
+    for table in scan_tables:
+        table.lock = threading.RLock()
+
+
+def scan_chunk(table_index, engine, predicates, start, stop):
+    table = scan_tables[table_index]
+    return array.array('i', FilterPlan(table, engine).scan(range(start, stop), predicates))
+
+
+def get_scan_pool(workers):
+    # processes are only forked again once rows are ingested into the tables they scan;
+    # a pool inherited from a parent process belongs to that process and is left alone
+    global scan_pool
+    versions = tuple(table.version for table in scan_tables)
+    if scan_pool is not None and scan_pool[:3] == (os.getpid(), workers, versions):
+        return scan_pool[3]
+    stop_scan_pool()
+    pool = multiprocessing.get_context('fork').Pool(workers, initializer=start_scan_worker)
+    scan_pool = (os.getpid(), workers, versions, pool)
+    return pool
+
+
+def start_scan_pool():
+    # forks the processes once web server workers are forked, rather than when large tables are first scanned
+    workers = parallel_workers()
+    if workers > 1 and any(len(table) >= settings.NOMS_OPS_PARALLEL_THRESHOLD for table in scan_tables):
+        with scan_pool_lock:
+            get_scan_pool(workers)
+
+
+def stop_scan_pool():
+    # also run at exit, before the modules used by the pool's threads are torn down
+    global scan_pool
+    if scan_pool is not None and scan_pool[0] == os.getpid():
+        scan_pool[3].terminate()
+    scan_pool = None
+
+
+atexit.register(stop_scan_pool)
+
+
+def parallel_scan(table, engine, window, predicates):
+    # scans a chunk of the window in each process; chunks are contiguous so concatenating their matching rows
+    # in turn merges them into the order that scanning the whole window gives
+    workers = parallel_workers()
+    size = -(-len(window) // workers)
+    table_index = next(index for index, scan_table in enumerate(scan_tables) if scan_table is table)
+    chunks = [
+        (table_index, engine, predicates, start, min(start + size, window.stop))
+        for start in range(window.start, window.stop, size)
+    ]
+    with scan_pool_lock:
+        parts = get_scan_pool(workers).starmap(scan_chunk, chunks)
+    if table.reverse_order:
+        parts.reverse()
+    row_ids = array.array('i')
+    for part in parts:
+        row_ids.extend(part)
+    return row_ids
+
+
+class FilterResults:
+    # sequence of the rows matching a filter plan for django's Paginator; only sliced pages are fetched
+    def __init__(self, plan, ordering):
+        self.plan = plan
+        self.ordering = ordering
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.plan.page(self.ordering, key.start or 0, key.stop)
+        return self.plan.page(self.ordering, key, key + 1)[0]
+
+    def count(self):
+        return self.plan.count()
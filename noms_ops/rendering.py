@@ -0,0 +1,244 @@
+import sys
+
+from django.conf import settings
+from django.utils.dateformat import format as format_date
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from noms_ops.cache import LRUCache
+from noms_ops.export import json_row
+from noms_ops.models import prisons, sources, methods, credit_statuses, disbursement_statuses
+from noms_ops.templatetags.noms_ops import currency
+
+# rendered rows of result tables as safe strings keyed on the renderer, table's id, row id and the version in which
+# the row last changed, limited by memory used
+row_html_cache = LRUCache(settings.NOMS_OPS_FRAGMENT_CACHE_SIZE, sizeof=sys.getsizeof)
+
+
+def counted(count, singular, plural):
+    return '%d %s' % (count, singular if count == 1 else plural)
+
+
+class RowRenderer:
+    # renders the rows of a result table as its template's loop would, but by formatting `template`
+    # with escaped values from `get_values` rather than resolving template variables cell by cell
+    template = ''
+
+    def get_values(self, row):
+        raise NotImplementedError
+
+    def render_row(self, table, row_id):
+        key = (self.__class__, table.cache_id, row_id, table.row_versions.get(row_id, 0))
+        fragment = row_html_cache.get(key)
+        if fragment is None:
+            values = {name: conditional_escape(value) for name, value in self.get_values(table[row_id]).items()}
+            fragment = self.template.format(dump=json_row(table, row_id), **values)
+            row_html_cache.set(key, fragment)
+        return fragment
+
+    def render(self, table, row_ids):
+        return mark_safe(''.join(self.render_row(table, row_id) for row_id in row_ids))
+
+
+class CreditRowRenderer(RowRenderer):
+    template = '''
+          <tr>
+            <td>
+              {received_at}
+            </td>
+            <td>
+              <a href="#">{prisoner_number}</a>
+              <br/>
+              {prisoner_name}
+            </td>
+            <td class="credit-arrow"></td>
+            <td>
+              <a href="#">{sender_name}</a>
+              <br/>
+              by {source}
+            </td>
+            <td>
+              {amount}
+            </td>
+            <td>
+              {prison}
+            </td>
+            <td>
+              {status}
+              <br/>
+              <a href="#">View details</a>
+            </td>
+            <!--
+            {dump}
+            -->
+          </tr>
+        '''
+
+    def get_values(self, row):
+        return {
+            'received_at': format_date(row['received_at'], 'j N Y'),
+            'prisoner_number': row['prisoner_number'],
+            'prisoner_name': row['prisoner_name'],
+            'sender_name': row['sender_name'],
+            'source': sources.get(row['source'], row['source']),
+            'amount': currency(row['amount']),
+            'prison': prisons.get(row['prison'], row['prison']),
+            'status': credit_statuses.get(row['status'], row['status']),
+        }
+
+
+class SenderRowRenderer(RowRenderer):
+    template = '''
+          <tr>
+            <td>
+              <a href="#">{sender_name}</a>
+              <br/>
+              by {source}
+            </td>
+            <td>
+              {credit_count}
+            </td>
+            <td>
+              {prisoner_count}
+            </td>
+            <td>
+              {prison_count}
+            </td>
+            <td>
+              {credit_total}
+            </td>
+            <!--
+            {dump}
+            -->
+          </tr>
+        '''
+
+    def get_values(self, row):
+        return {
+            'sender_name': row['sender_name'],
+            'source': sources.get(row['source'], row['source']),
+            'credit_count': counted(row['credit_count'], 'credit sent', 'credits sent'),
+            'prisoner_count': counted(row['prisoner_count'], 'prisoner', 'prisoners'),
+            'prison_count': counted(row['prison_count'], 'prison', 'prisons'),
+            'credit_total': currency(row['credit_total']),
+        }
+
+
+class PrisonerRowRenderer(RowRenderer):
+    template = '''
+          <tr>
+            <td>
+              <a href="#">{prisoner_number}</a>
+              <br/>
+              {prisoner_name}
+            </td>
+            <td>
+              {prison}
+            </td>
+            {totals}
+            <!--
+            {dump}
+            -->
+          </tr>
+        '''
+    totals_template = ''
+
+    def get_values(self, row):
+        prison = row['prison']
+        if prison:
+            prison = prisons.get(prison, prison)
+        else:
+            prison = mark_safe(
+                '<span title="Not currently in a public prison in England or Wales" class="help-tooltip">None</span>'
+            )
+        return {
+            'prisoner_number': row['prisoner_number'],
+            'prisoner_name': row['prisoner_name'],
+            'prison': prison,
+            'totals': format_html(self.totals_template, *self.get_totals(row)),
+        }
+
+    def get_totals(self, row):
+        raise NotImplementedError
+
+
+class PrisonerCreditRowRenderer(PrisonerRowRenderer):
+    totals_template = '''<td>
+              {}
+            </td>
+            <td>
+              {}
+            </td>
+            <td>
+              {}
+            </td>'''
+
+    def get_totals(self, row):
+        return (
+            counted(row['credit_count'], 'credit received', 'credits received'),
+            counted(row['sender_count'], 'payment source', 'payment sources'),
+            currency(row['credit_total']),
+        )
+
+
+class PrisonerDisbursementRowRenderer(PrisonerRowRenderer):
+    totals_template = '''<td>
+              {}
+            </td>
+            <td>
+              {}
+            </td>'''
+
+    def get_totals(self, row):
+        return (
+            counted(row['disbursement_count'], 'disbursement sent', 'disbursements sent'),
+            currency(row['disbursement_total']),
+        )
+
+
+class DisbursementRowRenderer(RowRenderer):
+    template = '''
+          <tr>
+            <td>
+              {created}
+            </td>
+            <td>
+              <a href="#">{prisoner_number}</a>
+              <br/>
+              {prisoner_name}
+            </td>
+            <td class="disbursement-arrow"></td>
+            <td>
+              {recipient_first_name} {recipient_last_name}
+              <br/>
+              by {method}
+            </td>
+            <td>
+              {amount}
+            </td>
+            <td>
+              {prison}
+            </td>
+            <td>
+              {resolution}
+              <br/>
+              <a href="#">View details</a>
+            </td>
+            <!--
+            {dump}
+            -->
+          </tr>
+        '''
+
+    def get_values(self, row):
+        return {
+            'created': format_date(row['created'], 'j N Y'),
+            'prisoner_number': row['prisoner_number'],
+            'prisoner_name': row['prisoner_name'],
+            'recipient_first_name': row['recipient_first_name'],
+            'recipient_last_name': row['recipient_last_name'],
+            'method': methods.get(row['method'], row['method']),
+            'amount': currency(row['amount']),
+            'prison': prisons.get(row['prison'], row['prison']),
+            'resolution': disbursement_statuses.get(row['resolution'], row['resolution']),
+        }
@@ -0,0 +1,155 @@
+import array
+import collections
+import heapq
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from noms_ops.cube import DAY
+from noms_ops.graph import credit_graph
+from noms_ops.models import AmountPattern
+from noms_ops.query import AmountMatches
+from noms_ops.tables import credits_list, prisoner_list, sender_list
+
+# amount patterns that need no amount are counted per sender or prisoner; for the others, the most credits sharing
+# one exact amount or one number of pence (other than none) are found instead
+counted_patterns = [pattern.name for pattern in AmountPattern if pattern.name not in ('exact', 'pence')]
+
+features = collections.OrderedDict([('credits', 'Credits')])
+features.update((pattern, AmountPattern[pattern].value) for pattern in counted_patterns)
+features.update([
+    ('exact', 'Most of one amount'),
+    ('pence', 'Most with one number of pence'),
+    ('busiest_day', 'Most in one day'),
+    ('counterparties', 'Distinct counterparties'),
+])
+
+
+def most_per_entity(entities, keys, size):
+    # the most rows sharing one key for each entity, given numpy arrays of non-negative entities and keys
+    most = numpy.zeros(size, dtype=numpy.int64)
+    if not len(keys):
+        return most
+    span = int(keys.max()) + 1
+    pairs = numpy.sort(entities.astype(numpy.int64) * span + keys)
+    starts = numpy.flatnonzero(numpy.append(True, pairs[1:] != pairs[:-1]))
+    counts = numpy.diff(numpy.append(starts, len(pairs)))
+    pair_entities = pairs[starts] // span
+    entity_starts = numpy.flatnonzero(numpy.append(True, pair_entities[1:] != pair_entities[:-1]))
+    most[pair_entities[entity_starts]] = numpy.maximum.reduceat(counts, entity_starts)
+    return most
+
+
+class CreditScan:
+    # every amount pattern and velocity features of the credits of each sender or prisoner evaluated in one pass
+    # over all credits rather than one filter at a time; senders or prisoners are ranked by the sum of their
+    # features, each relative to its mean over those with any credits
+    def __init__(self, key, table, degrees):
+        self.key = key
+        self.table = table
+        self.degrees = degrees
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.key)
+
+    def scan(self):
+        # arrays of each feature keyed on name, in the order of `features`
+        if numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy':
+            scanned = self.numpy_scan()
+        else:
+            scanned = self.python_scan()
+        scanned['counterparties'] = self.degrees()
+        return scanned
+
+    def numpy_scan(self):
+        size = len(self.table)
+        columns = credits_list.columns
+        scanned = collections.OrderedDict()
+        with credits_list.lock:
+            entities = numpy.asarray(columns[self.key].values)
+            amounts = numpy.asarray(columns['amount'].values)
+            days = numpy.asarray(columns['received_at'].values) // DAY
+            scanned['credits'] = numpy.bincount(entities, minlength=size)
+            for pattern in counted_patterns:
+                matches = AmountMatches('amount', pattern).mask_columns([columns['amount']], None)
+                scanned[pattern] = numpy.bincount(entities[matches], minlength=size)
+            scanned['exact'] = most_per_entity(entities, amounts, size)
+            pence = amounts % 100
+            scanned['pence'] = most_per_entity(entities[pence != 0], pence[pence != 0], size)
+            scanned['busiest_day'] = most_per_entity(entities, days - days.min() if len(days) else days, size)
+        return collections.OrderedDict(
+            (name, array.array('q', values.astype(numpy.int64).tobytes()))
+            for name, values in scanned.items()
+        )
+
+    def python_scan(self):
+        size = len(self.table)
+        columns = credits_list.columns
+        scanned = collections.OrderedDict(
+            (name, array.array('q', bytes(8 * size)))
+            for name in features
+            if name != 'counterparties'
+        )
+        credits = scanned['credits']
+        tests = [(scanned[pattern], AmountMatches('amount', pattern).get_test()) for pattern in counted_patterns]
+        groups = {name: collections.Counter() for name in ('exact', 'pence', 'busiest_day')}
+        exact, pence, busiest_day = groups['exact'], groups['pence'], groups['busiest_day']
+        for entity, amount, received_at in zip(columns[self.key].values, columns['amount'].values,
+                                               columns['received_at'].values):
+            credits[entity] += 1
+            for counts, test in tests:
+                if test(amount):
+                    counts[entity] += 1
+            exact[entity, amount] += 1
+            if amount % 100:
+                pence[entity, amount % 100] += 1
+            busiest_day[entity, received_at // DAY] += 1
+        for name, counter in groups.items():
+            most = scanned[name]
+            for (entity, _), count in counter.items():
+                if count > most[entity]:
+                    most[entity] = count
+        return scanned
+
+    def scores(self, scanned):
+        scanned = list(scanned.values())
+        credits = scanned[0]
+        active = sum(1 for count in credits if count) or 1
+        means = [(sum(values) / active) or 1 for values in scanned]
+        if numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy':
+            scores = numpy.zeros(len(credits))
+            for values, mean in zip(scanned, means):
+                scores += numpy.asarray(values) / mean
+            return array.array('d', scores.tobytes())
+        scores = array.array('d', bytes(8 * len(credits)))
+        for values, mean in zip(scanned, means):
+            for entity, value in enumerate(values):
+                scores[entity] += value / mean
+        return scores
+
+    def report(self, top=20):
+        # the highest scoring rows as (row, score, features) with the features keyed on name
+        scanned = self.scan()
+        scores = self.scores(scanned)
+        if numpy is not None and settings.NOMS_OPS_FILTER_ENGINE == 'numpy':
+            scores_array = numpy.asarray(scores)
+            ranked = numpy.lexsort((numpy.arange(len(scores)), -scores_array))[:top].tolist()
+        else:
+            ranked = heapq.nsmallest(top, range(len(scores)), key=lambda entity: (-scores[entity], entity))
+        return [
+            (
+                self.table[entity],
+                scores[entity],
+                collections.OrderedDict((name, values[entity]) for name, values in scanned.items()),
+            )
+            for entity in ranked
+        ]
+
+
+sender_scan = CreditScan('sender_id', sender_list, credit_graph.degrees)
+prisoner_scan = CreditScan('prisoner_id', prisoner_list, credit_graph.reverse_degrees)
+scans = {'sender': sender_scan, 'prisoner': prisoner_scan}
@@ -0,0 +1,26 @@
+import collections
+import contextlib
+import time
+
+# seconds spent in each stage of starting up, in the order that stages first ran
+timings = collections.OrderedDict()
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start_time
+
+
+def startup_report(total_time):
+    # where `total_time` seconds of starting up went; time not spent in a timed stage is mostly imports
+    lines = ['Started up in %0.2fs' % total_time]
+    other_time = total_time
+    for stage, stage_time in timings.items():
+        lines.append('  %s: %0.2fs (%0.0f%%)' % (stage, stage_time, 100 * stage_time / total_time))
+        other_time -= stage_time
+    lines.append('  imports and Django set-up: %0.2fs (%0.0f%%)' % (other_time, 100 * other_time / total_time))
+    return '\n'.join(lines)
@@ -0,0 +1,321 @@
+import array
+import collections.abc
+import datetime
+import itertools
+import threading
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+table_ids = itertools.count()
+
+
+def growable(values):
+    # an array copied from a memory view, e.g. of a mapped dataset file, or the values unchanged
+    if isinstance(values, memoryview):
+        copy = array.array(values.format)
+        copy.frombytes(values.cast('B'))
+        return copy
+    return values
+
+
+class Column:
+    values = ()
+    # value of columns not given when appending a row
+    default = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, row_id):
+        return self.values[row_id]
+
+    def append(self, value):
+        self.values.append(value)
+
+    def sort_key(self):
+        return self.__getitem__
+
+    def freeze(self):
+        pass
+
+    def thaw(self):
+        self.values = growable(self.values)
+
+
+class IntegerColumn(Column):
+    default = 0
+
+    def __init__(self, values=(), typecode='q'):
+        self.values = array.array(typecode, values)
+
+
+class ForeignKeyColumn(IntegerColumn):
+    def __init__(self, values=()):
+        super().__init__(values, typecode='i')
+
+
+class DateTimeColumn(Column):
+    # naive datetimes stored as microseconds since the epoch
+    def __init__(self, values=()):
+        self.values = array.array('q', map(self.encode, values))
+
+    @classmethod
+    def encode(cls, value):
+        return (value - EPOCH) // MICROSECOND
+
+    @classmethod
+    def decode(cls, value):
+        return EPOCH + datetime.timedelta(microseconds=value)
+
+    def __getitem__(self, row_id):
+        return self.decode(self.values[row_id])
+
+    def append(self, value):
+        self.values.append(self.encode(value))
+
+    def sort_key(self):
+        return self.values.__getitem__
+
+
+class CategoryColumn(Column):
+    # dictionary-encoded strings, e.g. prison or status codes; new categories are added as they are seen
+    def __init__(self, values=(), categories=()):
+        self.categories = []
+        self.codes = {}
+        for category in categories:
+            self.encode(category)
+        self.values = array.array('h', map(self.encode, values))
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def __getitem__(self, row_id):
+        return self.categories[self.values[row_id]]
+
+    def append(self, value):
+        self.values.append(self.encode(value))
+
+
+class CategorySetColumn(Column):
+    # sets of categories stored as bit masks, e.g. the prisons that a sender has sent money to
+    default = ()
+
+    def __init__(self, categories, values=()):
+        self.categories = list(categories)
+        if len(self.categories) > 64:
+            raise ValueError('Too many categories to store as a bit mask')
+        self.codes = {category: code for code, category in enumerate(self.categories)}
+        self.values = array.array('Q', map(self.encode, values))
+
+    def encode(self, value):
+        mask = 0
+        for category in value:
+            mask |= 1 << self.codes[category]
+        return mask
+
+    def __getitem__(self, row_id):
+        mask = self.values[row_id]
+        return [category for code, category in enumerate(self.categories) if mask & (1 << code)]
+
+    def append(self, value):
+        self.values.append(self.encode(value))
+
+    def add(self, row_id, category):
+        self.values[row_id] |= 1 << self.codes[category]
+
+
+class StringColumn(Column):
+    default = ''
+
+    def __init__(self, values=()):
+        self.values = list(values)
+
+    def freeze(self):
+        if not isinstance(self.values, PackedStrings):
+            self.values = PackedStrings(self.values)
+
+    def thaw(self):
+        if isinstance(self.values, PackedStrings):
+            self.values.thaw()
+
+
+class PackedStrings(collections.abc.Sequence):
+    # strings encoded end to end in one buffer and decoded when read, replacing a list of string objects;
+    # reading them does not write to their memory so it stays shared by processes forked after packing
+    def __init__(self, values=()):
+        values = [value.encode() for value in values]
+        self.buffer = bytearray().join(values)
+        self.offsets = array.array('q', [0])
+        self.offsets.extend(itertools.accumulate(map(len, values)))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        return str(self.buffer[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def thaw(self):
+        # strings mapped from a dataset file are copied before more are added
+        if isinstance(self.buffer, memoryview):
+            self.buffer = bytearray(self.buffer)
+            self.offsets = growable(self.offsets)
+
+    def append(self, value):
+        self.buffer.extend(value.encode())
+        self.offsets.append(len(self.buffer))
+
+
+class RowIdColumn(Column):
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, row_id):
+        return row_id
+
+
+class LookupColumn(Column):
+    # a column of a referenced table seen through a foreign key
+    def __init__(self, keys, key, table, name):
+        self.keys = keys
+        self.key = key
+        self.table = table
+        self.name = name
+        self.column = table.columns[name]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, row_id):
+        return self.column[self.keys[row_id]]
+
+    def sort_key(self):
+        keys, key = self.keys, self.column.sort_key()
+        return lambda row_id: key(keys[row_id])
+
+
+# rows are stored as typed columns and handed out as lightweight `Row` mappings which also expose
+# the columns of referenced tables, e.g. a credit's prisoner name;
+# tables stored in ascending date order are presented newest first by setting `reverse_order`
+class Table:
+    def __init__(self, columns, references=(), reverse_order=False):
+        self.columns = collections.OrderedDict(id=RowIdColumn(self))
+        self.columns.update(columns)
+        self.length = len(next(iter(columns.values()))) if columns else 0
+        self.reverse_order = reverse_order
+        self.references = collections.OrderedDict()
+        for key, table, names in references:
+            for name in names:
+                if name not in self.columns and name not in self.references:
+                    self.references[name] = LookupColumn(self.columns[key], key, table, name)
+        self.keys = list(self.columns) + list(self.references)
+        self.indexes = {}
+        self.orderings = {}
+        # incremented whenever rows are added or changed; rows changed in place record the version they changed in
+        self.version = 0
+        self.row_versions = {}
+        # identifies the table in cache keys, which would otherwise keep tables alive, e.g. of expired date windows
+        self.cache_id = next(table_ids)
+        # held while rows are added and while numpy views of columns exist as arrays cannot grow while viewed
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, row_id):
+        return Row(self, row_id)
+
+    def __iter__(self):
+        return map(self.__getitem__, self.row_ids())
+
+    def __repr__(self):
+        return '<%s: %d rows>' % (self.__class__.__name__, self.length)
+
+    def append(self, values):
+        # adds a row from a mapping of column names to values, updating indexes and orderings in place
+        with self.lock:
+            self.thaw()
+            row_id = self.length
+            for name, column in self.columns.items():
+                if not isinstance(column, RowIdColumn):
+                    column.append(values.get(name, column.default))
+            self.length += 1
+            for index in self.indexes.values():
+                index.add(row_id)
+            for ordering in self.orderings.values():
+                ordering.add(row_id)
+            self.version += 1
+        return row_id
+
+    def changed(self, row_id, *names):
+        # moves a row within the orderings by columns whose values were changed in place;
+        # such columns must not be indexed
+        with self.lock:
+            self.thaw()
+            for name in names:
+                for ordering in (name, '-%s' % name):
+                    if ordering in self.orderings:
+                        self.orderings[ordering].move(row_id)
+            self.version += 1
+            self.row_versions[row_id] = self.version
+
+    def freeze(self):
+        # packs columns and indexes holding many Python objects into buffers, see PackedStrings
+        for column in self.columns.values():
+            column.freeze()
+        for index in self.indexes.values():
+            if hasattr(index, 'freeze'):
+                index.freeze()
+
+    def thaw(self):
+        # copies columns, indexes and orderings mapped from a dataset file into growable arrays and dicts
+        for column in self.columns.values():
+            column.thaw()
+        for index in self.indexes.values():
+            index.thaw()
+        for ordering in self.orderings.values():
+            ordering.thaw()
+
+    def row_ids(self, window=None):
+        if window is None:
+            window = range(self.length)
+        if self.reverse_order:
+            return window[::-1]
+        return window
+
+    def column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.references[name]
+        return column
+
+
+class Row(collections.abc.Mapping):
+    __slots__ = ('table', 'id')
+
+    def __init__(self, table, row_id):
+        self.table = table
+        self.id = row_id
+
+    def __getitem__(self, key):
+        return self.table.column(key)[self.id]
+
+    def __iter__(self):
+        return iter(self.table.keys)
+
+    def __len__(self):
+        return len(self.table.keys)
+
+    def __repr__(self):
+        return '<%s: %d>' % (self.__class__.__name__, self.id)
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+from noms_ops.models import load_tables
+from noms_ops.query import register_scan_tables
+from noms_ops.startup import timed
+
+# the loaded dataset, kept apart from noms_ops.models so that importing models, as django does for every management
+# command, does not load it; commands that only generate or build datasets therefore never load one they do not use
+prisoner_list, sender_list, recipient_list, credits_list, disbursement_list, current_prisoner_list = load_tables()
+if settings.NOMS_OPS_FREEZE_TABLES:
+    with timed('freeze tables'):
+        for table in (prisoner_list, sender_list, recipient_list, credits_list, disbursement_list):
+            table.freeze()
+register_scan_tables(prisoner_list, sender_list, recipient_list, credits_list, disbursement_list)
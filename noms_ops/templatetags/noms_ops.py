@@ -1,18 +1,22 @@
 import itertools
 import json
-from urllib.parse import urlencode
 
 from django import template
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.html import format_html_join
 from django.utils.safestring import mark_safe
 
+from noms_ops.export import json_html_escapes, json_row
+from noms_ops.store import Row
+
 register = template.Library()
 
 
 @register.filter
-def dump_object(credit):
-    return mark_safe(json.dumps(credit, cls=DjangoJSONEncoder))
+def dump_object(obj):
+    if isinstance(obj, Row):
+        return json_row(obj.table, obj.id)
+    return mark_safe(json.dumps(dict(obj), cls=DjangoJSONEncoder).translate(json_html_escapes))
 
 
 @register.filter
@@ -35,7 +39,7 @@ def section_selected(form, key):
 
 @register.simple_tag
 def hidden_fields_excluding_section(form, key):
-    data = form.get_query_data()
+    data = form.query_data
     included = itertools.chain.from_iterable(form.sections[section] for section in form.sections if section != key)
     excluded = set(data.keys()) - set(included) - {'ordering'}
     return format_html_join(
@@ -57,9 +61,17 @@ def ordering_classes(form, ordering):
 
 @register.filter
 def query_string_with_reversed_ordering(form, ordering):
-    data = form.get_query_data()
-    current_ordering = data.get('ordering')
+    current_ordering = form.query_data.get('ordering')
     if current_ordering == ordering:
         ordering = '-%s' % ordering
-    data['ordering'] = ordering
-    return urlencode(data, doseq=True)
+    return form.get_query_string(exclude=('page',), ordering=ordering)
+
+
+@register.filter
+def query_string_with_export(form, export_format):
+    return form.get_query_string(exclude=('page', 'page_size'), export=export_format)
+
+
+@register.filter
+def query_string_with_page(form, page):
+    return form.get_query_string(page=page)
@@ -1,13 +1,16 @@
 from django.urls import path
 
-from noms_ops.views import CreditView, SenderView, PrisonerView, DisbursementView
+from noms_ops.views import CreditView, SenderView, PrisonerView, DisbursementView, \
+    CreditIngestView, DisbursementIngestView
 
 app_name = 'noms_ops'
 urlpatterns = [
     path('credits/', CreditView.as_view(), name='credits'),
     path('credits/senders/', SenderView.as_view(), name='senders'),
     path('credits/prisoners/', PrisonerView.as_view(axis='credits'), name='prisoners'),
+    path('credits/ingest/', CreditIngestView.as_view(), name='ingest-credit'),
 
     path('disbursements/', DisbursementView.as_view(), name='disbursements'),
     path('disbursements/prisoners/', PrisonerView.as_view(axis='disbursements'), name='prisoners-disbursements'),
+    path('disbursements/ingest/', DisbursementIngestView.as_view(), name='ingest-disbursement'),
 ]
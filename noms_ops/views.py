@@ -1,12 +1,74 @@
-from django.views.generic import FormView
+import json
 
-from noms_ops.forms import CreditForm, SenderForm, PrisonerForm, DisbursementForm
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.text import slugify
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import FormView, View
+
+from noms_ops.export import export_formats, export_names, json_rows, row_json_cache
+from noms_ops.forms import CreditForm, SenderForm, PrisonerCreditForm, PrisonerDisbursementForm, DisbursementForm
+from noms_ops.ingest import ingester
 from noms_ops.models import prisons, sources, methods, credit_statuses, disbursement_statuses
+from noms_ops.query import result_cache
+from noms_ops.rendering import row_html_cache, CreditRowRenderer, SenderRowRenderer, PrisonerCreditRowRenderer, \
+    PrisonerDisbursementRowRenderer, DisbursementRowRenderer
 
 
 class FilterView(FormView):
     get = FormView.post
-    form_valid = FormView.form_invalid
+    paginate_by = 100
+    row_renderer = None
+
+    def is_json(self):
+        return self.request.GET.get('format') == 'json'
+
+    def form_valid(self, form):
+        if self.is_json():
+            return self.render_json(form)
+        export_format = self.request.GET.get('export')
+        if export_format in export_formats:
+            return self.export(form, export_format)
+        return self.render_to_response(self.get_context_data(form=form))
+
+    def form_invalid(self, form):
+        if self.is_json():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return super().form_invalid(form)
+
+    def get_page(self, form):
+        page_size, page = None, None
+        if form.is_valid():
+            page_size, page = form.cleaned_data.get('page_size'), form.cleaned_data.get('page')
+        paginator = Paginator(form.results, page_size or self.paginate_by)
+        return paginator, paginator.get_page(page)
+
+    def render_json(self, form):
+        # a page of results encoded in one pass, joining the cached encoding of each row
+        paginator, page_obj = self.get_page(form)
+        rows = json_rows(form.object_source, (row.id for row in page_obj.object_list))
+        content = '{"count": %d, "page": %d, "num_pages": %d, "results": [%s]}' % (
+            paginator.count, page_obj.number, paginator.num_pages, ', '.join(rows),
+        )
+        return HttpResponse(content, content_type='application/json')
+
+    def export(self, form, export_format):
+        # streams all matching rows, encoding them in chunks so that memory use does not grow with the results
+        content_type, encode = export_formats[export_format]
+        plan = form.get_filter_plan()
+        response = StreamingHttpResponse(
+            encode(plan.table, export_names(plan.table), plan.ordered_row_ids(form.get_ordering())),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (slugify(self.title), export_format)
+        return response
+
+    def get_row_renderer(self):
+        return self.row_renderer
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -15,14 +77,28 @@ class FilterView(FormView):
 
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
+        paginator, page_obj = self.get_page(context_data['form'])
         context_data.update(
-            object_list=context_data['form'].object_list,
+            object_list=page_obj.object_list,
+            paginator=paginator,
+            page_obj=page_obj,
             prisons=prisons,
             sources=sources,
             methods=methods,
             credit_statuses=credit_statuses,
             disbursement_statuses=disbursement_statuses,
         )
+        row_renderer = self.get_row_renderer()
+        if row_renderer and settings.NOMS_OPS_ROW_RENDERER == 'compiled':
+            # templates fall back to their own loop when there are no rows
+            context_data['rendered_rows'] = row_renderer.render(
+                context_data['form'].object_source, (row.id for row in page_obj.object_list)
+            )
+        if settings.DEBUG:
+            context_data['result_cache_info'] = result_cache.cache_info()
+            # rendered after rows have been encoded
+            context_data['row_cache'] = row_json_cache
+            context_data['fragment_cache_info'] = row_html_cache.cache_info()
         return context_data
 
 
@@ -30,22 +106,80 @@ class CreditView(FilterView):
     title = 'Credits'
     template_name = 'noms_ops/credits.html'
     form_class = CreditForm
+    row_renderer = CreditRowRenderer()
 
 
 class SenderView(FilterView):
     title = 'Payment sources'
     template_name = 'noms_ops/senders.html'
     form_class = SenderForm
+    row_renderer = SenderRowRenderer()
 
 
 class PrisonerView(FilterView):
     title = 'Prisoners'
     template_name = 'noms_ops/prisoners.html'
-    form_class = PrisonerForm
+    form_class = PrisonerCreditForm
     axis = None
 
+    def get_form_class(self):
+        if self.axis == 'disbursements':
+            return PrisonerDisbursementForm
+        return PrisonerCreditForm
+
+    def get_row_renderer(self):
+        if self.axis == 'disbursements':
+            return PrisonerDisbursementRowRenderer()
+        return PrisonerCreditRowRenderer()
+
 
 class DisbursementView(FilterView):
     title = 'Disbursements'
     template_name = 'noms_ops/disbursements.html'
     form_class = DisbursementForm
+    row_renderer = DisbursementRowRenderer()
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class IngestView(View):
+    http_method_names = ['post']
+
+    def post(self, request):
+        try:
+            row_id = self.ingest(json.loads(request.body.decode()))
+        except (KeyError, TypeError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'id': row_id}, status=201)
+
+    def ingest(self, data):
+        raise NotImplementedError
+
+    def parse_datetime(self, value):
+        if not value:
+            return None
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError('Invalid date and time')
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return value
+
+
+class CreditIngestView(IngestView):
+    def ingest(self, data):
+        return ingester.add_credit(
+            data['prisoner'], data['sender'], data['amount'],
+            received_at=self.parse_datetime(data.get('received_at')),
+            status=data.get('status', 'pending'),
+            prison=data.get('prison'),
+        )
+
+
+class DisbursementIngestView(IngestView):
+    def ingest(self, data):
+        return ingester.add_disbursement(
+            data['prisoner'], data['recipient'], data['amount'],
+            created=self.parse_datetime(data.get('created')),
+            resolution=data.get('resolution', 'entered'),
+            prison=data.get('prison'),
+        )
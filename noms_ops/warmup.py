@@ -0,0 +1,54 @@
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from noms_ops.cube import cubes
+from noms_ops.graph import graphs
+from noms_ops.startup import timed
+
+
+def template_names():
+    # templates of the project rather than of installed packages, which are compiled as they are extended
+    template_dirs = list(settings.TEMPLATES[0]['DIRS'])
+    template_dirs.append(os.path.join(apps.get_app_config('noms_ops').path, 'templates'))
+    for template_dir in template_dirs:
+        for path, _, file_names in os.walk(template_dir):
+            for file_name in file_names:
+                if file_name.endswith('.html'):
+                    yield os.path.relpath(os.path.join(path, file_name), template_dir)
+
+
+def compile_templates():
+    # fills the cached template loaders
+    for template_name in template_names():
+        get_template(template_name)
+
+
+def render_pages():
+    # the first page of each list, which loads included and extended templates and
+    # fills the result, row encoding and row fragment caches for the most commonly viewed rows
+    factory = RequestFactory()
+    for url_name in ('index', 'noms_ops:credits', 'noms_ops:senders', 'noms_ops:prisoners', 'noms_ops:disbursements',
+                     'noms_ops:prisoners-disbursements'):
+        path = reverse(url_name)
+        match = resolve(path)
+        response = match.func(factory.get(path), *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+
+
+def warm_up():
+    # run before web server workers are forked so that they start with everything above already done
+    with timed('compile templates'):
+        compile_templates()
+    with timed('render first pages'):
+        render_pages()
+    # otherwise built by each worker when a date window or network filter is first chosen
+    for cube in cubes:
+        cube.build()
+    for graph in graphs:
+        graph.build()